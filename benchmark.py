@@ -0,0 +1,307 @@
+#RTD Bus Simulation - Benchmarks
+#CSCI 4203
+#Created by: Koy Kubasta
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import bussimulation
+
+
+###########################################################
+#Times a full day of simulation at increasing ridership   #
+#   levels to check how runtime scales with riders        #
+#PARAMS:                                                  #
+#   -riderLevels: list of rider counts to simulate        #
+#   -timeBetweenBus: time (in minutes) between busses     #
+#   -seed: seed for the random number generator so every  #
+#       level is run on a reproducible population         #
+#RETURNS:                                                 #
+#   -A list of (riders, seconds) tuples                   #
+###########################################################
+def benchmarkScaling(riderLevels, timeBetweenBus=15, seed=4203):
+    routes = bussimulation.loadRoutes("routes.json")
+    results = []
+    for riders in riderLevels:
+        start = time.perf_counter()
+        bussimulation.runDay(riders, timeBetweenBus, routes, seed)
+        elapsed = time.perf_counter() - start
+        results.append((riders, elapsed))
+        print(str(riders) + " riders: " + str(round(elapsed, 3)) + " s, "
+              + str(round(elapsed / riders * 1e6, 3)) + " us per rider")
+
+    return results
+
+
+###########################################################
+#Times each event scheduler backend on the bus events of  #
+#   a day, moving every bus along its route with no       #
+#   riders so only the scheduler is being measured        #
+#PARAMS:                                                  #
+#   -timeBetweenBus: time (in minutes) between busses     #
+#   -repeats: number of days to replay per backend        #
+#RETURNS:                                                 #
+#   -Dictionary of events per second keyed by backend     #
+###########################################################
+def benchmarkSchedulers(timeBetweenBus=5, repeats=5):
+    routes = bussimulation.loadRoutes("routes.json")
+    results = {}
+    for name in bussimulation.SCHEDULERS:
+        events = 0
+        elapsed = 0
+        for _ in range(repeats):
+            schedule = bussimulation.generateSchedule(timeBetweenBus, routes, name)
+            start = time.perf_counter()
+            while not schedule.empty():
+                event = schedule.get()
+                bus = event[2]
+                events += 1
+                route = bus.routeIndex
+                stop = bus.nextStopLocation
+                direction = bus.direction
+                if bussimulation.isFinalStop(direction, routes, route, stop):
+                    continue
+                bus.nextStopTime = event[0] + bussimulation.getTimeToNextStop(routes, route, stop, direction)
+                bus.nextStopLocation = bussimulation.getNextStop(direction, routes, route, stop)
+                schedule.put((bus.nextStopTime, bus.id, bus))
+            elapsed += time.perf_counter() - start
+        results[name] = events / elapsed
+        print(name + " scheduler: " + str(round(results[name])) + " events per second")
+
+    return results
+
+
+###########################################################
+#Runs one day and measures it from inside the process it  #
+#   ran in. Kept at module level so it can be sent to a   #
+#   fresh worker process.                                 #
+#PARAMS:                                                  #
+#   -repeats: times to run the day, keeping the median    #
+#RETURNS:                                                 #
+#   -Tuple of (seconds, peak resident memory in MB)       #
+###########################################################
+def measureDay(riders, timeBetweenBus, seed, repeats=1):
+    routes = bussimulation.loadRoutes("routes.json")
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        bussimulation.runDay(riders, timeBetweenBus, routes, seed)
+        times.append(time.perf_counter() - start)
+    elapsed = float(np.median(times))
+    #ru_maxrss is in kilobytes on Linux
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+###########################################################
+#Measures runtime and peak memory of a day at each        #
+#   ridership level, each in its own process so one       #
+#   level's peak memory does not hide another's           #
+#PARAMS:                                                  #
+#   -riderLevels: list of rider counts to simulate        #
+#   -timeBetweenBus: time (in minutes) between busses     #
+#   -seed: seed for the random number generator           #
+#RETURNS:                                                 #
+#   -A list of (riders, seconds, peak MB) tuples          #
+###########################################################
+def benchmarkMemory(riderLevels, timeBetweenBus=15, seed=4203):
+    results = []
+    for riders in riderLevels:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            elapsed, peak = pool.submit(measureDay, riders, timeBetweenBus, seed).result()
+        results.append((riders, elapsed, peak))
+        print(str(riders) + " riders: " + str(round(elapsed, 3)) + " s, "
+              + str(round(peak)) + " MB peak")
+
+    return results
+
+
+###########################################################
+#Counts the bus stop events in a day, one per bus per     #
+#   stop on its route                                     #
+#PARAMS:                                                  #
+#   -timeBetweenBus: time (in minutes) between busses     #
+#   -routes: compiled route information                   #
+#RETURNS:                                                 #
+#   -int number of events                                 #
+###########################################################
+def countEvents(timeBetweenBus, routes):
+    busses = (bussimulation.LAST_DEPARTURE - bussimulation.FIRST_DEPARTURE) // timeBetweenBus + 1
+    return sum(2 * busses * len(stops) for stops in routes['stops'])
+
+###########################################################
+#Times rider generation, schedule construction and the    #
+#   event loop on its own, for one ridership level and    #
+#   headway                                               #
+#PARAMS:                                                  #
+#   -riders: number of riders                             #
+#   -timeBetweenBus: time (in minutes) between busses     #
+#   -seed: seed for the random number generator           #
+#   -repeats: times to repeat each measurement, keeping   #
+#       the median                                        #
+#RETURNS:                                                 #
+#   -Dictionary of results keyed by benchmark name        #
+###########################################################
+def benchmarkPhases(riders, timeBetweenBus, seed, repeats=5):
+    routes = bussimulation.loadRoutes("routes.json")
+    results = {}
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        bussimulation.generateRiders(riders, routes, np.random.default_rng(seed))
+        times.append(time.perf_counter() - start)
+    elapsed = float(np.median(times))
+    results["generateRiders/" + str(riders)] = {'seconds': elapsed, 'ridersPerSecond': riders / elapsed}
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        schedule = bussimulation.generateSchedule(timeBetweenBus, routes)
+        times.append(time.perf_counter() - start)
+    elapsed = float(np.median(times))
+    results["generateSchedule/" + str(timeBetweenBus)] = {'seconds': elapsed,
+                                                          'eventsPerSecond': schedule.qsize() / elapsed}
+
+    #the event loop from runDay, timed without rider or schedule setup
+    times = []
+    for _ in range(repeats):
+        ridersWaiting = bussimulation.buildWaitingIndex(
+            bussimulation.generateRiders(riders, routes, np.random.default_rng(seed)))
+        schedule = bussimulation.generateSchedule(timeBetweenBus, routes)
+        busStats = bussimulation.generateEmptyBusStats(routes)
+        riderStats = bussimulation.generateEmptyRiderStats()
+        events = 0
+        start = time.perf_counter()
+        while not schedule.empty():
+            bus = schedule.get()[2]
+            bus, ridersWaiting, busStats, riderStats = bussimulation.processStop(bus, ridersWaiting, busStats,
+                                                                                riderStats, routes)
+            events += 1
+            if bus:
+                schedule.put((bus.nextStopTime, bus.id, bus))
+        times.append(time.perf_counter() - start)
+    elapsed = float(np.median(times))
+    results["processStop/" + str(riders) + "/" + str(timeBetweenBus)] = {
+        'seconds': elapsed,
+        'eventsPerSecond': events / elapsed,
+        'ridersPerSecond': riders / elapsed
+    }
+
+    return results
+
+###########################################################
+#Runs the full benchmark suite: whole days at each        #
+#   ridership level and headway, each in a fresh process  #
+#   to measure its peak memory, then the per-phase micro  #
+#   benchmarks                                            #
+#PARAMS:                                                  #
+#   -riderLevels: list of rider counts to simulate        #
+#   -headways: list of times (in minutes) between busses  #
+#   -seed: seed for the random number generator           #
+#   -repeats: times to repeat each day and event loop     #
+#       measurement, keeping the median so one slow or    #
+#       fast run does not move the result                 #
+#RETURNS:                                                 #
+#   -Dictionary of results keyed by benchmark name, each  #
+#       with seconds and whichever of eventsPerSecond,    #
+#       ridersPerSecond and peakMB apply                  #
+###########################################################
+def runSuite(riderLevels, headways, seed=4203, repeats=5):
+    routes = bussimulation.loadRoutes("routes.json")
+    results = {}
+    for riders in riderLevels:
+        for minutes in headways:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                elapsed, peak = pool.submit(measureDay, riders, minutes, seed, repeats).result()
+            results["runDay/" + str(riders) + "/" + str(minutes)] = {
+                'seconds': elapsed,
+                'eventsPerSecond': countEvents(minutes, routes) / elapsed,
+                'ridersPerSecond': riders / elapsed,
+                'peakMB': peak
+            }
+
+    results.update(benchmarkPhases(riderLevels[len(riderLevels)//2], headways[len(headways)//2], seed, repeats))
+
+    return results
+
+###########################################################
+#Compares benchmark results against a saved baseline      #
+#PARAMS:                                                  #
+#   -results: dictionary of results from runSuite         #
+#   -baseline: dictionary of earlier results              #
+#   -threshold: fraction a measurement may get worse by   #
+#       before it counts as a regression                  #
+#RETURNS:                                                 #
+#   -List of strings describing each regression           #
+###########################################################
+def findRegressions(results, baseline, threshold):
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for metric in ('eventsPerSecond', 'ridersPerSecond'):
+            if metric in results[name] and metric in baseline[name]:
+                if results[name][metric] < baseline[name][metric] * (1 - threshold):
+                    regressions.append(name + " " + metric + " fell from " + str(round(baseline[name][metric]))
+                                       + " to " + str(round(results[name][metric])))
+        if 'peakMB' in results[name] and 'peakMB' in baseline[name]:
+            if results[name]['peakMB'] > baseline[name]['peakMB'] * (1 + threshold):
+                regressions.append(name + " peakMB rose from " + str(round(baseline[name]['peakMB']))
+                                   + " to " + str(round(results[name]['peakMB'])))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bus simulation")
+    parser.add_argument("--riders", type=int, nargs="+", default=[80000, 120000, 500000], help="ridership levels")
+    parser.add_argument("--headways", type=int, nargs="+", default=[10, 15, 30], help="times between busses")
+    parser.add_argument("--seed", type=int, default=4203, help="seed for every run")
+    parser.add_argument("--repeats", type=int, default=5, help="times to repeat each measurement")
+    parser.add_argument("--output", default="benchmark_results.json", help="file to write results to")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="saved results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="fraction worse than baseline that is a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="save these results as the new baseline")
+    parser.add_argument("--scaling", action="store_true",
+                        help="run the scaling, scheduler and memory benchmarks instead of the suite")
+    args = parser.parse_args()
+
+    if args.scaling:
+        benchmarkScaling([80000, 120000, 250000, 500000, 1000000])
+        benchmarkSchedulers()
+        benchmarkMemory([1000000, 5000000])
+        return
+
+    results = runSuite(args.riders, args.headways, args.seed, args.repeats)
+    for name in sorted(results):
+        print(name + ": " + ", ".join(metric + "=" + str(round(value, 3)) for metric, value in sorted(results[name].items())))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        print("Saved baseline to " + args.baseline)
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = findRegressions(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against " + args.baseline)
+    else:
+        print("No baseline at " + args.baseline + ", run with --save-baseline to record one")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,158 +2,696 @@
 #CSCI 4203
 #Created by: Koy Kubasta
 
+import argparse
+import csv
+import functools
+import hashlib
+import heapq
 import json
-import random
+import os
+import pickle
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from queue import PriorityQueue
 
+import numpy as np
+
+#hours riders arrive at stops and the share of the day's riders arriving in each
+ARRIVAL_HOURS = [4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23]
+ARRIVAL_HOUR_SHARES = [0.004484111171, 0.0248666529, 0.04376089221, 0.05979855107, 0.05600818086, 0.05675233207, 0.05805339645, 0.06215102909, 0.06620785344, 0.06902602609, 0.07588421967, 0.08429072788, 0.08084602791, 0.0686707539, 0.0515816814, 0.03805733325, 0.02893788018, 0.02866662506, 0.02458819632, 0.01736752908]
+
+#first and last times (in minutes) busses leave the end of their route, 4AM and midnight
+FIRST_DEPARTURE = 240
+LAST_DEPARTURE = 1440
+
+#part of every result cache key, bump it whenever a change to the engines
+#   changes the results they give for the same seed so old results are not reused
+ENGINE_VERSION = 2
+
+#histogram bins are one unit wide below HISTOGRAM_EXACT, which covers every trip
+#   time on the current routes, then HISTOGRAM_SUBBINS bins per doubling above it
+HISTOGRAM_EXACT = 256
+HISTOGRAM_SUBBINS = 16
+HISTOGRAM_BINS = HISTOGRAM_EXACT + HISTOGRAM_SUBBINS * (31 - HISTOGRAM_EXACT.bit_length() + 1)
+#rider times kept as distributions as well as totals
+DISTRIBUTION_METRICS = ['timeWaitingForBus', 'timeOnBus', 'totalTime']
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Simulate RTD bus ridership over a parameter sweep")
+    parser.add_argument("--routes", default="routes.json",
+                        help="route file, JSON or a " + ROUTE_CACHE_SUFFIX + " file from gtfsimport.py")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes for the sweep")
+    parser.add_argument("--seed", type=int, default=None, help="master seed, every sweep cell's seed is derived from it")
+    parser.add_argument("--scheduler", choices=sorted(SCHEDULERS), default="bucket", help="event scheduler backend")
+    parser.add_argument("--engine", choices=["events", "sharded", "streaming", "analytic"], default="events",
+                        help="run the event loop, run it split by route over the workers, run it generating "
+                             "riders an hour at a time, or compute results directly with the analytic engine")
+    parser.add_argument("--days", type=int, default=1,
+                        help="days each cell runs with --engine streaming, its results totalled over every day")
+    parser.add_argument("--validate", action="store_true", help="check the analytic engine against the event loop and exit")
+    parser.add_argument("--profile", metavar="DIR", default=None,
+                        help="record phase timings and event loop counters for each cell to DIR")
+    parser.add_argument("--details", metavar="DIR", default=None,
+                        help="write a record of every rider trip and bus run to DIR")
+    parser.add_argument("--details-format", choices=["csv", "parquet"], default="csv",
+                        help="file format of the detail records, parquet needs pyarrow")
+    parser.add_argument("--cache", metavar="DIR", default=".resultcache",
+                        help="directory of saved cell results, reused when a sweep is run again with the same seed")
+    parser.add_argument("--cache-size", type=int, default=64, help="most megabytes of results to keep in the cache")
+    parser.add_argument("--no-cache", action="store_true", help="run every cell without reading or saving results")
+    parser.add_argument("--checkpoint", metavar="DIR", default=None,
+                        help="save each cell's run to DIR as it goes, and carry on interrupted cells from there")
+    parser.add_argument("--checkpoint-every", type=int, default=200000, help="bus stop events between checkpoints")
+    parser.add_argument("--optimize", type=int, metavar="RIDERS", default=None,
+                        help="search for the best headway of each route for RIDERS riders a day instead of the sweep")
+    parser.add_argument("--headway-range", type=int, nargs=2, metavar=("MIN", "MAX"), default=[5, 60],
+                        help="shortest and longest headway the optimizer may pick")
+    parser.add_argument("--replicate", type=float, metavar="WIDTH", default=None,
+                        help="replicate each cell until the 95%% confidence interval on its mean wait is at most "
+                             "WIDTH minutes wide")
+    parser.add_argument("--antithetic", action="store_true", help="pair each replication with its antithetic twin")
+    parser.add_argument("--max-replications", type=int, default=100, help="most replications of a cell")
+    args = parser.parse_args()
+    if args.profile and args.engine != "events":
+        parser.error("--profile needs --engine events")
+    if args.details and args.engine != "events":
+        parser.error("--details needs --engine events")
+    if args.days < 1 or args.days > 1 and args.engine != "streaming":
+        parser.error("--days needs --engine streaming and at least 1 day")
+    if args.checkpoint and args.engine not in ("events", "streaming"):
+        parser.error("--checkpoint needs --engine events or streaming")
+    if args.headway_range[0] < 1 or args.headway_range[0] > args.headway_range[1]:
+        parser.error("--headway-range needs 1 <= MIN <= MAX")
+    if args.checkpoint and args.profile:
+        parser.error("--checkpoint can not be used with --profile")
+    if args.replicate is not None and (args.engine not in ("events", "analytic") or args.profile or args.details
+                                       or args.checkpoint):
+        parser.error("--replicate needs --engine events or analytic, without --profile, --details or --checkpoint")
+
     printBusArt()
     #parameter sweep from 80,000 to 120,000 riders per day by increments of 10k
     #   and time between buses from 10 minutes to 30 minutes by increments of 5m
-    riders = 80000
-    while (riders <= 120000):
-        minutes = 10
-        while (minutes <= 30):
-            simulateDay(riders, minutes)
-            minutes += 5
-        riders += 10000
+    riderLevels = range(80000, 120001, 10000)
+    headways = range(10, 31, 5)
+
+    masterSeed = args.seed
+    if masterSeed is None:
+        masterSeed = int(np.random.SeedSequence().generate_state(1)[0])
+    print("Master seed: ", masterSeed)
+
+    routeLoadStart = time.perf_counter()
+    routes = loadRoutes(args.routes)
+    routeLoadTime = time.perf_counter() - routeLoadStart
+    if args.validate:
+        mismatches = validateEngines(riderLevels, headways, routes, masterSeed)
+        print("Engines disagree on cells: ", mismatches if mismatches else "none")
+        return
+
+    if args.optimize is not None:
+        #only the events engine and the analytic engine give the same results for the same riders
+        engine = "analytic" if args.engine == "analytic" else "events"
+        seed = cellSeed(masterSeed, args.optimize, 0)
+        result = optimizeHeadways(args.optimize, routes, seed,
+                                  range(args.headway_range[0], args.headway_range[1] + 1), engine=engine)
+        print(printFrontier(result, routes))
+        frontierWriter = RecordWriter("frontier.csv", ['riders', 'seed', 'weight', 'waitHours', 'ridersLeftBehind',
+                                                       'busHours', 'emptyBusHours']
+                                      + ['headway' + name for name in routes['names']])
+        for plan in result['frontier']:
+            frontierWriter.writeRow([args.optimize, seed, plan['weight'], plan['waitHours'], plan['ridersLeftBehind'],
+                                     plan['busHours'], plan['emptyBusHours']]
+                                    + [plan['headways'][name] for name in routes['names']])
+        frontierWriter.close()
+        return
+
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+    if args.checkpoint:
+        os.makedirs(args.checkpoint, exist_ok=True)
+
+    #each run replaces the result files rather than adding to another run's
+    riderStatsWriter = RecordWriter("riderstats.csv", RIDER_STATS_COLUMNS)
+    busStatsWriter = RecordWriter("busstats.csv", BUS_STATS_COLUMNS)
+    percentileWriter = RecordWriter("percentiles.csv", PERCENTILE_COLUMNS)
+    if args.details:
+        os.makedirs(args.details, exist_ok=True)
+        riderDetailWriter = RecordWriter(os.path.join(args.details, "riders." + args.details_format), RIDER_DETAIL_COLUMNS)
+        busDetailWriter = RecordWriter(os.path.join(args.details, "busses." + args.details_format), BUS_DETAIL_COLUMNS)
+
+    if args.replicate is not None:
+        results = runReplications(riderLevels, headways, routes, masterSeed, args.replicate, args.workers,
+                                  args.antithetic, maxReplications=args.max_replications, scheduler=args.scheduler,
+                                  engine=args.engine)
+        replicationWriter = RecordWriter("replications.csv", REPLICATION_COLUMNS)
+        for result in results:
+            replicationWriter.writeRow([result['riders'], result['minutes'], result['seed'], result['replications'],
+                                        result['days'], result['meanWait'], result['waitHalfWidth']])
+        replicationWriter.close()
+        print("Simulated ", sum(result['days'] for result in results), " days over ", len(results), " cells")
+    else:
+        #a random master seed gives cells no later run can reuse, so only given seeds are cached
+        cache = None
+        if args.seed is None and not args.no_cache:
+            print("Not caching results, since no --seed was given")
+        elif not args.no_cache:
+            cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+        results = runSweep(riderLevels, headways, routes, masterSeed, args.workers, args.scheduler, args.engine,
+                           args.profile is not None, args.details is not None, cache, args.checkpoint,
+                           args.checkpoint_every, args.days)
+        if cache is not None:
+            print("Reused ", cache.hits, " of ", len(results), " cells from ", args.cache)
+    for result in results:
+        outputStart = time.perf_counter()
+        if args.days > 1:
+            print("Simulated ", result['riders'], " riders a day for ", args.days, " days with busses every ",
+                  result['minutes'], " minutes")
+        else:
+            print("Simulated ", result['riders'], " riders on a day with busses every ", result['minutes'], " minutes")
+        if 'replications' in result:
+            print("Mean wait over ", result['replications'], " replications = ", result['meanWait'], " +/- ",
+                  result['waitHalfWidth'], " minutes")
+        print(printBusStats(result['busStats']))
+        print(printRiderStats(result['riderStats']))
+        writeRiderStats(riderStatsWriter, result['riders'], result['minutes'], result['seed'], result['riderStats'])
+        writeBusStats(busStatsWriter, result['riders'], result['minutes'], result['seed'], result['busStats'])
+        writePercentiles(percentileWriter, result['riders'], result['minutes'], result['seed'],
+                         result['riderStats'], result['busStats'])
+        if args.details:
+            writeDetails(riderDetailWriter, busDetailWriter, result['riders'], result['minutes'], result['seed'],
+                         result['details'], routes)
+
+        if args.profile:
+            report = result['profile']
+            report['phases']['routeLoad'] = routeLoadTime
+            report['phases']['statsOutput'] = time.perf_counter() - outputStart
+            writeProfile(report, os.path.join(args.profile, "profile_" + str(result['riders']) + "_" + str(result['minutes']) + ".json"))
+
+    riderStatsWriter.close()
+    busStatsWriter.close()
+    percentileWriter.close()
+    if args.details:
+        riderDetailWriter.close()
+        busDetailWriter.close()
 
 
 ###########################################################
-#Generates a list of riders for a day of bus ridership    #
+#Generates the riders for a day of bus ridership all at   #
+#   once, with each rider attribute drawn for every rider #
+#   in a single NumPy call.                               #
 #PARAMS:                                                  #
 #   -n: Number of riders to generate                      #
-#   -routes: A dictionary of route information, including #
-#           the share of ridership each route makes up in #
-#           in a given day.                               #
+#   -routes: compiled route information, as returned by  #
+#           compileRoutes                                 #
+#   -rng: NumPy random Generator to draw from, a fresh    #
+#           unseeded one is used if not given             #
 #RETURNS:                                                 #
-#   -A list of riders, sorted by time each rider arrives  #
-#      at the station.                                    #
+#   -A dictionary of NumPy arrays, one entry per rider,   #
+#      sorted by time each rider arrives at the station:  #
+#      'id', 'route' (index into routes), 'start' and     #
+#      'end' (index into the route's stops), 'direction', #
+#      and 'timeArrived'                                  #
 ###########################################################
-def generateRiders(n, routes):
-    riderList = []
-    for i in range(n):
-        riderList.append(generateRider(routes,i))
+def generateRiders(n, routes, rng=None):
+    if rng is None:
+        rng = np.random.default_rng()
 
-    riderList.sort()
-    
-    return riderList
+    riders = generateTrips(n, routes, rng)
 
+    #times will be stored in minutes, starting with t=1 at 12:01 AM day of business
+    hourShares = np.array(ARRIVAL_HOUR_SHARES)
+    hour = rng.choice(np.array(ARRIVAL_HOURS), size=n, p=hourShares/hourShares.sum())
+    minute = rng.integers(0, 60, size=n)
+    timeArrived = (60*hour + minute).astype(np.int32)
+
+    return sortRiders(riders, timeArrived)
 
 ###########################################################
-#Generates a single rider                                 #
+#Generates the riders arriving during one hour of the     #
+#   day, for feeding riders into the event loop as        #
+#   simulated time reaches each hour.                     #
 #PARAMS:                                                  #
-#   -routes: A dictionary of route information, including #
-#           the share of ridership each route makes up in #
-#           in a given day.                               #
-#   -riderNumber: int passed to give resulting tuple a    #
-#           unique number to prevent collisions in the    #
-#           priority queue                                #
+#   -n: Number of riders arriving during the hour         #
+#   -hour: hour of the day riders arrive in               #
+#   -routes: compiled route information                   #
+#   -rng: NumPy random Generator to draw from             #
 #RETURNS:                                                 #
-#   -A single Rider, containing start station,            #
-#       end station, route, and time arrived at station   #
+#   -A dictionary of rider arrays in the same form as     #
+#      generateRiders                                     #
 ###########################################################
-def generateRider(routes,riderNumber):
-    rider = {}
-    rider['id'] = riderNumber
-    #pick a random route for the rider to be on
-    proportions = [0.10865,0.09516,0.05263,0.34524,0.05543,0.11492,0.05391,0.11401,0.06005]
-    ridersRoute = random.choices(list(routes.keys()),proportions,k=1)[0]
-    rider['route'] = ridersRoute
+def generateRiderHour(n, hour, routes, rng):
+    riders = generateTrips(n, routes, rng)
+    timeArrived = (60*hour + rng.integers(0, 60, size=n)).astype(np.int32)
 
-    #pick a random stop on route for riders startingLocation
-    riderStart = random.choice(list(routes[ridersRoute]['stops']))
-    rider['startingLocation'] = riderStart
+    return sortRiders(riders, timeArrived)
 
-    #pick a random stop for rider to end trip
-    stops = routes[ridersRoute]['stops']
-    riderEnd = random.choice(list(stops))
-    #while loop to prevent rider starting and stopping at same location
-    while(riderStart == riderEnd):
-        riderEnd = random.choice(list(stops))
-    rider['endLocation'] = riderEnd
+###########################################################
+#Draws the route, start and end stop, and direction for   #
+#   n riders.                                             #
+#PARAMS:                                                  #
+#   -n: Number of riders                                  #
+#   -routes: compiled route information                   #
+#   -rng: NumPy random Generator to draw from             #
+#RETURNS:                                                 #
+#   -A dictionary of NumPy arrays: 'route', 'start',      #
+#      'end' and 'direction'                              #
+###########################################################
+def generateTrips(n, routes, rng):
+    shares = np.array(routes['ridershipShare'], dtype=float)
+    stopCounts = np.array([len(stops) for stops in routes['stops']])
 
-    #calculate direction rider needs to go
-    direction = stops.index(riderEnd) - stops.index(riderStart)
-    direction = direction / abs(direction) #direction == 1 if route goes north/east, and -1 if route goes south/west
-    rider['direction'] = direction
+    #pick a random route for each rider to be on
+    route = rng.choice(len(shares), size=n, p=shares/shares.sum()).astype(np.int32)
 
-    #generate time rider arrives at start location
-    #generate hour of arrival first
-    hours = [4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23]
-    proportions = [0.004484111171, 0.0248666529, 0.04376089221, 0.05979855107, 0.05600818086, 0.05675233207, 0.05805339645, 0.06215102909, 0.06620785344, 0.06902602609, 0.07588421967, 0.08429072788, 0.08084602791, 0.0686707539, 0.0515816814, 0.03805733325, 0.02893788018, 0.02866662506, 0.02458819632, 0.01736752908]
+    #pick a random start stop, then a random end stop from the remaining
+    #   stops, shifting past the start so the two are never the same
+    riderStops = stopCounts[route]
+    start = (rng.random(n) * riderStops).astype(np.int32)
+    end = (rng.random(n) * (riderStops - 1)).astype(np.int32)
+    end += (end >= start)
 
-    hour = random.choices(hours, proportions, k=1)[0]
-    minute = random.choice(range(60))
+    #direction == 1 if route goes north/east, and -1 if route goes south/west
+    direction = np.sign(end - start).astype(np.int8)
 
-    #times will be stored in minutes, starting with t=1 at 12:01 AM day of business
-    t = 60*hour + minute
-    rider['timeArrived'] = t
+    return {
+        'route': route,
+        'start': start,
+        'end': end,
+        'direction': direction
+    }
 
-    #return a tuple with t for time arrived, riderNumber to prevent issues sorting, and rider being the main data
-    return (t,riderNumber,rider)
-    
+###########################################################
+#Sorts riders by the time they arrive at their stop       #
+#PARAMS:                                                  #
+#   -riders: dictionary of rider arrays from generateTrips#
+#   -timeArrived: array of times each rider arrives       #
+#RETURNS:                                                 #
+#   -The riders with 'id' and 'timeArrived' added, every  #
+#      array sorted by time arrived                       #
+###########################################################
+def sortRiders(riders, timeArrived):
+    #stable sort keeps riders arriving the same minute in id order
+    order = np.argsort(timeArrived, kind='stable')
+    sortedRiders = {'id': order}
+    for column in riders:
+        sortedRiders[column] = riders[column][order]
+    sortedRiders['timeArrived'] = timeArrived[order]
+
+    return sortedRiders
+
+
+###########################################################
+#Generates a day's riders from uniform random numbers     #
+#   instead of drawing them, so a population can be paired #
+#   with its antithetic twin made from 1 - uniforms.      #
+#   Riders follow the same distributions as               #
+#   generateRiders, but are not the same draws.           #
+#PARAMS:                                                  #
+#   -uniforms: NumPy array of shape (5, n) of numbers in  #
+#       [0, 1] for each rider's route, start stop, end    #
+#       stop, hour and minute of arrival                  #
+#   -routes: compiled route information                   #
+#RETURNS:                                                 #
+#   -A dictionary of rider arrays in the same form as     #
+#      generateRiders                                     #
+###########################################################
+def generateRidersFromUniforms(uniforms, routes):
+    shares = np.array(routes['ridershipShare'], dtype=float)
+    hourShares = np.array(ARRIVAL_HOUR_SHARES)
+    stopCounts = np.array([len(stops) for stops in routes['stops']])
 
+    #inverse of each distribution's CDF, clipped since 1 - 0 is a possible uniform
+    route = np.minimum(np.searchsorted(np.cumsum(shares/shares.sum()), uniforms[0], side='right'),
+                       len(shares)-1).astype(np.int32)
+    riderStops = stopCounts[route]
+    start = np.minimum(uniforms[1] * riderStops, riderStops-1).astype(np.int32)
+    end = np.minimum(uniforms[2] * (riderStops-1), riderStops-2).astype(np.int32)
+    end += (end >= start)
+    direction = np.sign(end - start).astype(np.int8)
+    hour = np.array(ARRIVAL_HOURS)[np.minimum(np.searchsorted(np.cumsum(hourShares/hourShares.sum()), uniforms[3],
+                                                              side='right'), len(ARRIVAL_HOURS)-1)]
+    minute = np.minimum(uniforms[4] * 60, 59).astype(np.int64)
+    timeArrived = (60*hour + minute).astype(np.int32)
+
+    return sortRiders({'route': route, 'start': start, 'end': end, 'direction': direction}, timeArrived)
+
+###########################################################
+#Builds the compact table of riders used by the event     #
+#   loop, see WaitingRiders.                              #
+#PARAMS:                                                  #
+#   -riders: dictionary of rider arrays sorted by time    #
+#       arrived, as returned by generateRiders            #
+#RETURNS:                                                 #
+#   -WaitingRiders holding every rider of the day         #
+###########################################################
+def buildWaitingIndex(riders):
+    n = len(riders['timeArrived'])
+    stopCount = int(riders['start'].max()) + 1 if n else 1
+
+    #stable sort on the stop a rider waits at keeps each stop's riders in arrival order
+    queueKey = (2*riders['route'].astype(np.int64) + (riders['direction'] > 0)) * stopCount + riders['start']
+    order = np.argsort(queueKey, kind='stable')
+    sortedKeys = queueKey[order]
+    queueStarts = np.flatnonzero(np.diff(sortedKeys, prepend=-1))
+    queueEnds = np.append(queueStarts[1:], n)
+
+    queues = {}
+    for key, first, last in zip(sortedKeys[queueStarts].tolist(), queueStarts.tolist(), queueEnds.tolist()):
+        group, stop = divmod(key, stopCount)
+        route, upward = divmod(group, 2)
+        queues[(route, stop, 1 if upward else -1)] = [first, last]
+
+    return WaitingRiders(queues, toArray(order), toArray(riders['timeArrived'][order]),
+                         toArray(riders['timeArrived']), toArray(riders['end']))
+
+###########################################################
+#Copies a NumPy array of integers into a compact typed    #
+#   array, which is much faster than NumPy to index one   #
+#   element at a time from Python                         #
+###########################################################
+def toArray(values):
+    compact = array('i')
+    compact.frombytes(np.ascontiguousarray(values, dtype=np.int32).tobytes())
+    return compact
+
+###########################################################
+#Compact table of a whole day's riders. Riders are        #
+#   numbered by their position in the time sorted arrays, #
+#   and every column is a typed array indexed by that     #
+#   number. Waiting riders are indexed by the stop they   #
+#   are waiting at: 'order' lists riders grouped by       #
+#   (route, stop, direction) and by time arrived within   #
+#   each group, and 'queues' maps each group to           #
+#   [next rider to board, end of group] in 'order'.       #
+###########################################################
+class WaitingRiders:
+    __slots__ = ('queues', 'order', 'queueArrived', 'timeArrived', 'end', 'timeBoarded', 'timeTripEnded',
+                 'boardedCount', 'disboardedCount')
+
+    def __init__(self, queues, order, queueArrived, timeArrived, end):
+        self.queues = queues
+        self.order = order
+        self.queueArrived = queueArrived #time arrived of each rider in order
+        self.timeArrived = timeArrived
+        self.end = end
+        self.timeBoarded = array('i', [0]) * len(timeArrived)
+        self.timeTripEnded = array('i', [0]) * len(timeArrived)
+        self.boardedCount = 0
+        self.disboardedCount = 0
+
+    #boards riders at the stop who have arrived by time t, returns number boarded
+    def board(self, bus, route, stop, direction, t):
+        queue = self.queues.get((route, stop, direction))
+        if not queue:
+            return 0
+        position, lastPosition = queue
+        order = self.order
+        queueArrived = self.queueArrived
+        end = self.end
+        timeBoarded = self.timeBoarded
+        while(position < lastPosition and queueArrived[position] <= t):
+            rider = order[position]
+            timeBoarded[rider] = t
+            bus.ridersByStop[end[rider]].append(rider)
+            position += 1
+        boarded = position - queue[0]
+        queue[0] = position
+        self.boardedCount += boarded
+        return boarded
+
+    #takes riders getting off at the stop off the bus, returns number disboarded
+    def disboard(self, bus, stop, t, riderStats):
+        disboarding = bus.ridersByStop[stop]
+        bus.ridersByStop[stop] = []
+        timeArrived = self.timeArrived
+        timeBoarded = self.timeBoarded
+        timeTripEnded = self.timeTripEnded
+        for rider in disboarding:
+            timeTripEnded[rider] = t
+            trackRiderStats(riderStats, timeArrived[rider], timeBoarded[rider], t)
+        self.disboardedCount += len(disboarding)
+        return len(disboarding)
+
+    #number of riders who have arrived by time t and not yet boarded
+    def waitingCount(self, t):
+        #riders are numbered in order of time arrived
+        return bisect_right(self.timeArrived, t) - self.boardedCount
+
+###########################################################
+#Table of riders fed in a batch at a time as simulated    #
+#   time advances. Only riders waiting or on a bus are    #
+#   kept: riders are dropped once their trip is folded    #
+#   into riderStats, so memory follows the riders in the  #
+#   system rather than the riders in the day.             #
+###########################################################
+class StreamingRiders:
+    __slots__ = ('queues', 'riders', 'nextRider', 'boardedCount', 'disboardedCount', 'latestArrivals', 'earlierRiders',
+                 'routes', 'finished')
+
+    #finished trips held before they are added to the rider time distributions
+    FINISHED_BATCH = 65536
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.finished = (array('i'), array('i'), array('i'), array('i')) #route, arrived, boarded, trip ended
+        self.queues = {}
+        self.riders = {} #rider number -> [time arrived, end stop, time boarded]
+        self.nextRider = 0
+        self.boardedCount = 0
+        self.disboardedCount = 0
+        self.latestArrivals = [] #sorted arrival times of the last batch added
+        self.earlierRiders = 0 #riders added before the last batch
+
+    #adds a batch of riders from generateRiderHour, all arriving after every rider already added
+    def add(self, riders):
+        self.earlierRiders = self.nextRider
+        self.latestArrivals = riders['timeArrived'].tolist()
+        columns = zip(riders['route'].tolist(), riders['start'].tolist(), riders['end'].tolist(),
+                      riders['direction'].tolist(), riders['timeArrived'].tolist())
+        for route, start, end, direction, t in columns:
+            key = (route, start, direction)
+            if key not in self.queues:
+                self.queues[key] = deque()
+            self.queues[key].append(self.nextRider)
+            self.riders[self.nextRider] = [t, end, 0]
+            self.nextRider += 1
+
+    def board(self, bus, route, stop, direction, t):
+        queue = self.queues.get((route, stop, direction))
+        boarded = 0
+        while(queue and self.riders[queue[0]][0] <= t):
+            rider = queue.popleft()
+            self.riders[rider][2] = t
+            bus.ridersByStop[self.riders[rider][1]].append(rider)
+            boarded += 1
+        self.boardedCount += boarded
+        return boarded
+
+    def disboard(self, bus, stop, t, riderStats):
+        disboarding = bus.ridersByStop[stop]
+        bus.ridersByStop[stop] = []
+        route, arrived, boarded, ended = self.finished
+        for rider in disboarding:
+            timeArrived, end, timeBoarded = self.riders.pop(rider)
+            trackRiderStats(riderStats, timeArrived, timeBoarded, t)
+            route.append(bus.routeIndex)
+            arrived.append(timeArrived)
+            boarded.append(timeBoarded)
+            ended.append(t)
+        if len(route) >= self.FINISHED_BATCH:
+            self.flush(riderStats)
+        self.disboardedCount += len(disboarding)
+        return len(disboarding)
+
+    #adds the finished trips held so far to the rider time distributions
+    def flush(self, riderStats):
+        if self.finished[0]:
+            trackRiderDistributions(riderStats, self.routes, *[np.frombuffer(column, dtype=np.int32) for column in self.finished])
+            self.finished = (array('i'), array('i'), array('i'), array('i'))
+
+    #number of riders who have arrived by time t and not yet boarded, every
+    #   batch before the last is from an earlier hour so has fully arrived
+    def waitingCount(self, t):
+        return self.earlierRiders + bisect_right(self.latestArrivals, t) - self.boardedCount
+
+
+###########################################################
+#Event scheduler backed by a plain binary heap. Has the   #
+#   same put/get/empty interface as queue.PriorityQueue   #
+#   without taking a lock on every call, since the event  #
+#   loop only ever runs on one thread.                    #
+###########################################################
+class HeapScheduler:
+    __slots__ = ('events',)
+
+    def __init__(self):
+        self.events = []
+
+    def put(self, event):
+        heapq.heappush(self.events, event)
+
+    def get(self):
+        return heapq.heappop(self.events)
+
+    def empty(self):
+        return not self.events
+
+    #every event not yet taken out, in no particular order
+    def pending(self):
+        return list(self.events)
+
+    def qsize(self):
+        return len(self.events)
+
+###########################################################
+#Event scheduler backed by a calendar of one bucket per   #
+#   minute. Events must have integer times that are never #
+#   earlier than the last event taken out, which holds    #
+#   for busses since travel times are whole minutes. A    #
+#   bucket is sorted by bus number the first time it is   #
+#   drained, so events in the same minute come out in     #
+#   the same (time, busNumber) order as a heap.           #
+###########################################################
+class BucketScheduler:
+    __slots__ = ('buckets', 'minute', 'currentSorted', 'size')
+
+    def __init__(self):
+        self.buckets = []
+        self.minute = 0
+        self.currentSorted = False
+        self.size = 0
+
+    def put(self, event):
+        t = event[0]
+        if t < self.minute:
+            raise ValueError("cannot schedule an event at minute " + str(t) + " before minute " + str(self.minute))
+        while t >= len(self.buckets):
+            self.buckets.append([])
+        self.buckets[t].append(event)
+        if t == self.minute:
+            self.currentSorted = False
+        self.size += 1
+
+    def get(self):
+        if self.size == 0:
+            raise IndexError("get from an empty scheduler")
+        bucket = self.buckets[self.minute]
+        while not bucket:
+            self.minute += 1
+            self.currentSorted = False
+            bucket = self.buckets[self.minute]
+        if not self.currentSorted:
+            #largest bus number first, so popping off the end gives the smallest
+            bucket.sort(key=eventBusNumber, reverse=True)
+            self.currentSorted = True
+        self.size -= 1
+        return bucket.pop()
+
+    def empty(self):
+        return self.size == 0
+
+    def qsize(self):
+        return self.size
+
+    #every event not yet taken out, in no particular order
+    def pending(self):
+        return [event for bucket in self.buckets[self.minute:] for event in bucket]
+
+def eventBusNumber(event):
+    return event[1]
+
+#event scheduler backends by name, PriorityQueue is kept for comparison
+SCHEDULERS = {
+    'bucket': BucketScheduler,
+    'heap': HeapScheduler,
+    'queue': PriorityQueue
+}
 
 ###########################################################
 #Generates a bus schedule for the business day            #
 #PARAMS:                                                  #
 #   -timeBetweenBusses: Time (in minutes) between busses  #
 #       on a given route                                  #
-#   -routes: A dictionary of route information, including #
-#           stops on a route, and time between stops on   #
-#           the route.                                    #
+#   -routes: compiled route information, as returned by  #
+#           compileRoutes                                 #
+#   -scheduler: name of the event scheduler backend to    #
+#           use, one of the keys of SCHEDULERS            #
+#   -routeIndexes: routes to schedule busses for, None    #
+#           for every route                               #
 #RETURNS:                                                 #
-#   -A priority queue of bus stop schedule, sorted by     #
-#       time each bus arrives at a given stop.            #
+#   -A scheduler of bus stop events, giving back events   #
+#       by time each bus arrives at a given stop, then    #
+#       by bus number.                                    #
 ###########################################################
-def generateSchedule(timeBetweenBusses, routes):
-    schedule = PriorityQueue()
+def generateSchedule(timeBetweenBusses, routes, scheduler='bucket', routeIndexes=None):
+    schedule = SCHEDULERS[scheduler]()
 
     busNumber = 0
-    for route in routes:
+    for route in range(len(routes['names'])):
+        #busses of routes left out still take their numbers, so every bus
+        #   keeps the number it has in the full schedule
+        scheduled = routeIndexes is None or route in routeIndexes
         #generate all busses for each direction for entire day
-        t = 240  #4AM busses start
-        while(t <= 1440): #last busses leave right at midnight
-            #schedule southbound and westbound busses
-            schedule.put((t,busNumber,generateBus(routes,route,-1,t,busNumber)))
-            busNumber += 1
-            #schedule northbound and eastbound busses
-            schedule.put((t,busNumber,generateBus(routes,route,1,t,busNumber)))
-            busNumber += 1
+        t = FIRST_DEPARTURE  #4AM busses start
+        while(t <= LAST_DEPARTURE): #last busses leave right at midnight
+            if scheduled:
+                #schedule southbound and westbound busses
+                schedule.put((t,busNumber,generateBus(routes,route,-1,t,busNumber)))
+                #schedule northbound and eastbound busses
+                schedule.put((t,busNumber+1,generateBus(routes,route,1,t,busNumber+1)))
+            busNumber += 2
 
             t += timeBetweenBusses
 
     return schedule
 
+###########################################################
+#A single bus. Riders on the bus are carried only as      #
+#   rider ids, filed under the stop they get off at so a  #
+#   stop can drop its riders without searching the bus.   #
+###########################################################
+class Bus:
+    __slots__ = ('id', 'route', 'routeIndex', 'direction', 'timeDeparted', 'nextStopTime', 'nextStopLocation',
+                 'ridersByStop', 'riderCount', 'mostSimultaneousRiders', 'timeEmpty', 'timeRunning',
+                 'totalRiders')
+
+    def __init__(self, busNumber, route, routeIndex, direction, time, stopCount):
+        self.id = busNumber
+        self.route = route
+        self.routeIndex = routeIndex
+        self.direction = direction
+        self.timeDeparted = time
+        self.nextStopTime = time
+        self.nextStopLocation = 0
+        self.ridersByStop = [[] for _ in range(stopCount)]
+        self.riderCount = 0
+        self.mostSimultaneousRiders = 0
+        self.timeEmpty = 0
+        self.timeRunning = 0
+        self.totalRiders = 0
+
 ###########################################################
 #Generates a single bus                                   #
 #PARAMS:                                                  #
-#   -routes: A dictionary of route information, including #
-#           the share of ridership each route makes up in #
-#           in a given day.                               #
+#   -routes: compiled route information, as returned by  #
+#           compileRoutes                                 #
+#   -route: index of the bus's route                      #
 #RETURNS:                                                 #
 #   -A single bus, containing start station,              #
 #       route, and time to arrive at station              #
 ###########################################################
 def generateBus(routes,route,direction,time,busNumber):
-    bus = {
-        'id': busNumber,
-        'route' : route,
-        'direction' : direction,
-        'nextStopTime' : time,
-        'currentRiders' : [],
-        'mostSimultaneousRiders' : 0,
-        'timeEmpty': 0,
-        'timeRunning': 0,
-        'totalRiders': 0
-    }
+    stops = routes['stops'][route]
+    bus = Bus(busNumber, routes['names'][route], route, direction, time, len(stops))
 
-    stops = routes[route]['stops']
     if direction == -1: #south or west bound busses
-        bus['nextStopLocation'] = stops[len(stops)-1]
+        bus.nextStopLocation = len(stops)-1
     else:
-        bus['nextStopLocation'] = stops[0]
+        bus.nextStopLocation = 0
 
     return bus
 
@@ -163,65 +701,54 @@ def generateBus(routes,route,direction,time,busNumber):
 #   at the current stop going the same direction board    #
 #   the bus.                                              #
 #PARAMS:                                                  #
-#   -bus: dictionary of bus being processed at current    #
-#       stop. Contains stop in bus['nextStopLocation']    #
-#   -ridersWaiting: list of riders waiting for a bus      #
+#   -bus: Bus being processed at current stop. Contains   #
+#       the index of the stop on its route in             #
+#       bus.nextStopLocation                              #
+#   -ridersWaiting: table of riders, WaitingRiders from   #
+#       buildWaitingIndex or StreamingRiders              #
 #RETURNS:                                                 #
 #   -updated bus to replace bus passed in as a param,     #
 #       returns None in this position if bus completes    #
 #       route.                                            #
-#   -updated ridersWaiting list with riders boarding      #
-#       removed from the list                             #
+#   -updated ridersWaiting table with riders boarding     #
+#       removed from their stop's queue                   #
 ###########################################################
-def processStop(bus,ridersWaiting, busStats, riderStats,routeData):
+def processStop(bus,ridersWaiting, busStats, riderStats,routes):
     #get relevant data from bus
-    route = bus['route']
-    stop = bus['nextStopLocation']
-    direction = bus['direction']
-    t = bus['nextStopTime']
+    route = bus.routeIndex
+    stop = bus.nextStopLocation
+    direction = bus.direction
+    t = bus.nextStopTime
 
     #have necessary riders disboard
-    i = 0
-    while (i < len(bus['currentRiders'])) :
-        rider = bus['currentRiders'][i]
-        if (rider['endLocation'] == stop):
-            bus['currentRiders'].remove(rider)
-            rider['timeTripEnded'] = t
-            riderStats = trackRiderStats(riderStats,rider)
-            i -= 1
-        i += 1
+    if bus.ridersByStop[stop]:
+        bus.riderCount -= ridersWaiting.disboard(bus, stop, t, riderStats)
 
     #check if bus is at final stop
 
-    if(isFinalStop(direction, routeData[route]['stops'], stop)):
+    if(isFinalStop(direction, routes, route, stop)):
         busStats = trackBusStats(busStats,bus)
         return None, ridersWaiting, busStats, riderStats
 
     #have riders waiting at stop board bus
-    i = 0
-    while(i < len(ridersWaiting) and ridersWaiting[i][2]['timeArrived'] <= t):
-        rider = ridersWaiting[i][2]
-        if (rider['startingLocation'] == stop and rider['direction'] == direction and rider['route'] == route):
-            ridersWaiting.remove(ridersWaiting[i])
-            rider['timeBoarded'] = t
-            bus['currentRiders'].append(rider)
-            bus['totalRiders'] += 1
-            i -= 1
-        i += 1
+    #only riders at this stop going this direction who have already arrived
+    boarded = ridersWaiting.board(bus, route, stop, direction, t)
+    bus.riderCount += boarded
+    bus.totalRiders += boarded
 
     #update bus for next stop
-    bus['nextStopLocation'] = getNextStop(direction, routeData[route]['stops'], stop)
+    bus.nextStopLocation = getNextStop(direction, routes, route, stop)
 
     #calculate time to next stop
-    timeToNextStop = getTimeToNextStop(routeData[route],stop,direction)
-    if ( not bus['currentRiders'] ):
-        bus['timeEmpty'] += timeToNextStop
+    timeToNextStop = getTimeToNextStop(routes, route, stop, direction)
+    if ( not bus.riderCount ):
+        bus.timeEmpty += timeToNextStop
     
-    if ( len(bus['currentRiders']) > bus['mostSimultaneousRiders'] ):
-        bus['mostSimultaneousRiders'] = len(bus['currentRiders'])
+    if ( bus.riderCount > bus.mostSimultaneousRiders ):
+        bus.mostSimultaneousRiders = bus.riderCount
 
-    bus['nextStopTime'] = t + timeToNextStop
-    bus['timeRunning'] += timeToNextStop
+    bus.nextStopTime = t + timeToNextStop
+    bus.timeRunning += timeToNextStop
 
     return bus, ridersWaiting, busStats, riderStats
 
@@ -229,44 +756,42 @@ def processStop(bus,ridersWaiting, busStats, riderStats,routeData):
 ###########################################################
 #Calculates the time between stops                        #
 #PARAMS:                                                  #
-#   -routeData: dictionary containing route stops and     #
-#       time to reach each stop from the first stop       #
-#   -currentStop: string containing name of current stop  #
+#   -routes: compiled route information                   #
+#   -route: index of the route                            #
+#   -currentStop: index of current stop on the route      #
 #   -direction: direction bus is heading                  #
 #RETURNS:                                                 #
 #   -int representing minutes until next stop             #
 ###########################################################
-def getTimeToNextStop(routeData,currentStop,direction):
-    nextStop = getNextStop(direction,routeData['stops'],currentStop)
-    indexOfNextStop = routeData['stops'].index(nextStop)
-    indexOfCurrentStop = routeData['stops'].index(currentStop)
-    t = (routeData['timeFromFirstStop'][indexOfNextStop] - routeData['timeFromFirstStop'][indexOfCurrentStop]) * direction
-    return t
+def getTimeToNextStop(routes,route,currentStop,direction):
+    return routes['travelTime'][route][direction][currentStop]
 
 ###########################################################
-#Gets the name of the next stop location                  #
+#Gets the next stop location                              #
 #PARAMS:                                                  #
 #   -direction: direction bus is heading                  #
-#   -routeStops: list containing route stops              #
-#   -currentStop: string containing name of current stop  #
+#   -routes: compiled route information                   #
+#   -route: index of the route                            #
+#   -currentStop: index of current stop on the route      #
 #RETURNS:                                                 #
-#   -string with name of next stop on route               #
+#   -int index of next stop on route                      #
 ###########################################################
-def getNextStop(direction,routeStops,currentStop):
-    return routeStops[routeStops.index(currentStop)+direction]
+def getNextStop(direction,routes,route,currentStop):
+    return routes['nextStop'][route][direction][currentStop]
 
 ###########################################################
 #Checks if current stop on route is the final stop        #
 #PARAMS:                                                  #
 #   -direction: direction bus is heading                  #
-#   -routeStops: list containing route stops              #
-#   -stop: string containing name of current stop         #
+#   -routes: compiled route information                   #
+#   -route: index of the route                            #
+#   -stop: index of current stop on the route             #
 #RETURNS:                                                 #
 #   -boolean, true if current stop is final stop, false   #
 #       if current stop is not the final stop             #
 ###########################################################
-def isFinalStop(direction,routeStops,stop):
-    return (direction == -1 and routeStops.index(stop) == 0) or (direction == 1 and routeStops.index(stop) == len(routeStops)-1)
+def isFinalStop(direction,routes,route,stop):
+    return routes['isFinal'][route][direction][stop]
 
 ###########################################################
 #Simulates ridership for a full day based on given        #
@@ -277,34 +802,1248 @@ def isFinalStop(direction,routeStops,stop):
 #   -timeBetweenBus: time (in minutes) between busses of  #
 #       the same route (for example 15 would mean 15      #
 #       any route will have a bus come every 15 minutes)  #
+#   -seed: seed for generating riders, None for a fresh   #
+#       random population                                 #
+#   -cache: ResultCache to reuse an earlier day's results #
+#       from, only used when a seed is given              #
 #RETURNS:                                                 #
 #   -Nothing, but prints statistics of simulation to the  #
 #       console, and writes detailed breakdowns of each   #
 #       individual bus and rider to a file for more       #
 #       in depth analysis                                 #
 ###########################################################
-def simulateDay(numberOfRiders,timeBetweenBus):
+def simulateDay(numberOfRiders,timeBetweenBus,seed=None,cache=None):
     print("Simulating ", numberOfRiders, " riders on a day with busses every ", timeBetweenBus, " minutes...")
-    routeData = loadRouteData("routes.json")
-    ridersWaiting = generateRiders(numberOfRiders, routeData)
-    busSchedule = generateSchedule(timeBetweenBus, routeData)
+    routes = loadRoutes("routes.json")
+    result = None
+    if cache is not None and seed is not None:
+        key = resultKey(numberOfRiders, timeBetweenBus, seed, 'events', routes)
+        result = cache.get(key)
+    if result is None:
+        busStats, riderStats = runDay(numberOfRiders, timeBetweenBus, routes, seed)
+        if cache is not None and seed is not None:
+            cache.put(key, {'busStats': busStats, 'riderStats': riderStats})
+    else:
+        busStats, riderStats = result['busStats'], result['riderStats']
+    
+    print(printBusStats(busStats))
+    print(printRiderStats(riderStats))
+    riderStatsWriter = RecordWriter("riderstats.csv", RIDER_STATS_COLUMNS, append=True)
+    writeRiderStats(riderStatsWriter, numberOfRiders, timeBetweenBus, seed, riderStats)
+    riderStatsWriter.close()
+    busStatsWriter = RecordWriter("busstats.csv", BUS_STATS_COLUMNS, append=True)
+    writeBusStats(busStatsWriter, numberOfRiders, timeBetweenBus, seed, busStats)
+    busStatsWriter.close()
+    percentileWriter = RecordWriter("percentiles.csv", PERCENTILE_COLUMNS, append=True)
+    writePercentiles(percentileWriter, numberOfRiders, timeBetweenBus, seed, riderStats, busStats)
+    percentileWriter.close()
 
-    busStats = generateEmptyBusStats(routeData)
-    riderStats = generateEmptyRiderStats()
+###########################################################
+#Runs the event loop for a full day without printing or   #
+#   writing any results.                                  #
+#PARAMS:                                                  #
+#   -numberOfRiders: total number of riders to board      #
+#       busses throughout the day                         #
+#   -timeBetweenBus: time (in minutes) between busses of  #
+#       the same route                                    #
+#   -routes: compiled route information                   #
+#   -seed: seed for generating riders, None for a fresh   #
+#       random population                                 #
+#   -scheduler: name of the event scheduler backend       #
+#   -profile: Profiler to record the run in, None to run  #
+#       without instrumentation                           #
+#   -details: dictionary to fill in with 'riders', a      #
+#       dictionary of per rider arrays, and 'busses', the #
+#       list of every Bus run, None to keep no details    #
+#   -checkpoint: Checkpoint to save the run to as it      #
+#       goes, None to keep no checkpoints                 #
+#RETURNS:                                                 #
+#   -busStats dictionary and riderStats dictionary        #
+###########################################################
+def runDay(numberOfRiders,timeBetweenBus,routes,seed=None,scheduler='bucket',profile=None,details=None,checkpoint=None):
+    #a resumed run regenerates its riders, so they have to come from a known seed
+    if checkpoint is not None and seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    if profile is not None:
+        profile.startPhase('riderGeneration')
+    riders = generateRiders(numberOfRiders, routes, np.random.default_rng(seed))
+    ridersWaiting = buildWaitingIndex(riders)
+    if profile is not None:
+        profile.startPhase('scheduleBuild')
+    busSchedule = generateSchedule(timeBetweenBus, routes, scheduler)
+
+    run = {
+        'engine': 'events',
+        'numberOfRiders': numberOfRiders,
+        'timeBetweenBus': timeBetweenBus,
+        'seed': seed,
+        'scheduler': scheduler,
+        'busSchedule': busSchedule,
+        'ridersWaiting': ridersWaiting,
+        'busStats': generateEmptyBusStats(routes),
+        'riderStats': generateEmptyRiderStats(),
+        'finishedBusses': [] if details is not None else None
+    }
+    return runEventLoop(run, riders, routes, profile, details, checkpoint)
+
+###########################################################
+#Runs the event loop of runDay from wherever its state    #
+#   is, the start of the day or a restored checkpoint.    #
+#PARAMS:                                                  #
+#   -run: dictionary of the run's settings and state, the #
+#       schedule, riders waiting, stats and finished      #
+#       busses, which the loop updates in place           #
+#   -riders: dictionary of the day's rider arrays         #
+#   -routes: compiled route information                   #
+#   -profile, details, checkpoint: as for runDay          #
+#RETURNS:                                                 #
+#   -busStats dictionary and riderStats dictionary        #
+###########################################################
+def runEventLoop(run,riders,routes,profile=None,details=None,checkpoint=None):
+    busSchedule = run['busSchedule']
+    ridersWaiting = run['ridersWaiting']
+    busStats = run['busStats']
+    riderStats = run['riderStats']
+    finishedBusses = run['finishedBusses']
 
+    if profile is not None:
+        profile.startPhase('eventLoop')
     while(not busSchedule.empty()):
         nextBus = busSchedule.get()
         bus = nextBus[2]
-        bus, ridersWaiting, busStats, riderStats = processStop(bus, ridersWaiting, busStats, riderStats,routeData)
+        if profile is not None:
+            scannedBefore = ridersWaiting.boardedCount + ridersWaiting.disboardedCount
+        bus, ridersWaiting, busStats, riderStats = processStop(bus, ridersWaiting, busStats, riderStats,routes)
+        if profile is not None:
+            scanned = ridersWaiting.boardedCount + ridersWaiting.disboardedCount - scannedBefore
+            profile.recordEvent(nextBus[0], busSchedule.qsize(), ridersWaiting, scanned)
         
         if(bus):
-            nextBus = (bus['nextStopTime'], bus['id'], bus)
+            nextBus = (bus.nextStopTime, bus.id, bus)
             busSchedule.put(nextBus)
-    
-    print(printBusStats(busStats))
-    print(printRiderStats(riderStats))
-    writeRiderStats(numberOfRiders,timeBetweenBus,riderStats)
-    writeBusStats(numberOfRiders,timeBetweenBus,busStats)
+        elif details is not None:
+            finishedBusses.append(nextBus[2])
+
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save(run, routes)
+
+    trackFinishedRiders(riderStats, routes, riders, ridersWaiting)
+    if profile is not None:
+        profile.endPhase()
+
+    if details is not None:
+        details['riders'] = {
+            'rider': riders['id'],
+            'route': riders['route'],
+            'start': riders['start'],
+            'end': riders['end'],
+            'direction': riders['direction'],
+            'timeArrived': riders['timeArrived'],
+            'timeBoarded': np.frombuffer(ridersWaiting.timeBoarded, dtype=np.int32),
+            'timeTripEnded': np.frombuffer(ridersWaiting.timeTripEnded, dtype=np.int32)
+        }
+        details['busses'] = finishedBusses
+
+    return busStats, riderStats
+
+###########################################################
+#Runs the event loop for a full day split by route.       #
+#   Riders never transfer and busses of different routes  #
+#   never meet, so each group of routes is simulated on   #
+#   its own with only its riders and busses, and the      #
+#   groups' statistics are merged. Riders are generated   #
+#   once for the whole day, so results are the same as    #
+#   runDay for the same seed.                             #
+#PARAMS:                                                  #
+#   -numberOfRiders: total number of riders to board      #
+#       busses throughout the day                         #
+#   -timeBetweenBus: time (in minutes) between busses of  #
+#       the same route                                    #
+#   -routes: compiled route information                   #
+#   -seed: seed for generating riders, None for a fresh   #
+#       random population                                 #
+#   -scheduler: name of the event scheduler backend       #
+#   -workers: number of shards, each run in its own       #
+#       process if more than 1                            #
+#   -pool: ProcessPoolExecutor to run shards in, instead  #
+#       of starting one for this day                      #
+#RETURNS:                                                 #
+#   -busStats dictionary and riderStats dictionary        #
+###########################################################
+def runDaySharded(numberOfRiders,timeBetweenBus,routes,seed=None,scheduler='bucket',workers=1,pool=None):
+    riders = generateRiders(numberOfRiders, routes, np.random.default_rng(seed))
+    shards = []
+    for routeIndexes in shardRoutes(riders, timeBetweenBus, routes, workers):
+        inShard = np.isin(riders['route'], routeIndexes)
+        shards.append(({column: values[inShard] for column, values in riders.items()}, routeIndexes))
+
+    if len(shards) <= 1:
+        results = [runShard(shardRiders, timeBetweenBus, routes, routeIndexes, scheduler)
+                   for shardRiders, routeIndexes in shards]
+    elif pool is not None:
+        futures = [pool.submit(runShard, shardRiders, timeBetweenBus, routes, routeIndexes, scheduler)
+                   for shardRiders, routeIndexes in shards]
+        results = [future.result() for future in futures]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards)) as shardPool:
+            futures = [shardPool.submit(runShard, shardRiders, timeBetweenBus, routes, routeIndexes, scheduler)
+                       for shardRiders, routeIndexes in shards]
+            results = [future.result() for future in futures]
+
+    busStats = generateEmptyBusStats(routes)
+    riderStats = generateEmptyRiderStats()
+    for shardBusStats, shardRiderStats in results:
+        mergeBusStats(busStats, shardBusStats)
+        mergeRiderStats(riderStats, shardRiderStats)
+
+    return busStats, riderStats
+
+###########################################################
+#Splits routes into groups of about equal work, counted   #
+#   as the riders on each route plus the stops its busses #
+#   make, biggest route first into the least loaded group #
+#PARAMS:                                                  #
+#   -riders: dictionary of rider arrays for the day       #
+#   -timeBetweenBus: time (in minutes) between busses     #
+#   -routes: compiled route information                   #
+#   -shardCount: most groups to make                      #
+#RETURNS:                                                 #
+#   -List of lists of route indexes, leaving out empty    #
+#       groups                                            #
+###########################################################
+def shardRoutes(riders,timeBetweenBus,routes,shardCount):
+    routeCount = len(routes['names'])
+    busses = 2 * ((LAST_DEPARTURE - FIRST_DEPARTURE) // timeBetweenBus + 1)
+    work = np.bincount(riders['route'], minlength=routeCount).tolist()
+    for route in range(routeCount):
+        work[route] += busses * len(routes['stops'][route])
+
+    shards = [[] for _ in range(max(1, min(shardCount, routeCount)))]
+    shardWork = [0] * len(shards)
+    for route in sorted(range(routeCount), key=lambda route: -work[route]):
+        least = shardWork.index(min(shardWork))
+        shards[least].append(route)
+        shardWork[least] += work[route]
+
+    return [sorted(shard) for shard in shards if shard]
+
+###########################################################
+#Runs the event loop over one shard's routes. Kept at     #
+#   module level so worker processes can pickle it.       #
+#PARAMS:                                                  #
+#   -riders: dictionary of rider arrays, only riders on   #
+#       the shard's routes                                #
+#   -timeBetweenBus: time (in minutes) between busses     #
+#   -routes: compiled route information                   #
+#   -routeIndexes: routes in the shard, None for every    #
+#       route, which runs a whole day on given riders     #
+#   -scheduler: name of the event scheduler backend       #
+#RETURNS:                                                 #
+#   -busStats dictionary, filled in for the shard's       #
+#       routes only, and riderStats dictionary            #
+###########################################################
+def runShard(riders,timeBetweenBus,routes,routeIndexes,scheduler='bucket'):
+    ridersWaiting = buildWaitingIndex(riders)
+    busSchedule = generateSchedule(timeBetweenBus, routes, scheduler, routeIndexes)
+
+    busStats = generateEmptyBusStats(routes)
+    riderStats = generateEmptyRiderStats()
+
+    while(not busSchedule.empty()):
+        bus = busSchedule.get()[2]
+        bus, ridersWaiting, busStats, riderStats = processStop(bus, ridersWaiting, busStats, riderStats,routes)
+
+        if(bus):
+            busSchedule.put((bus.nextStopTime, bus.id, bus))
+
+    trackFinishedRiders(riderStats, routes, riders, ridersWaiting)
+    return busStats, riderStats
+
+###########################################################
+#Adds the riders of a WaitingRiders table who finished    #
+#   their trip to the rider time distributions            #
+#PARAMS:                                                  #
+#   -riderStats: Dictionary of tracked rider statistics   #
+#   -routes: compiled route information                   #
+#   -riders: dictionary of rider arrays the table was     #
+#       built from                                        #
+#   -ridersWaiting: WaitingRiders after the event loop    #
+###########################################################
+def trackFinishedRiders(riderStats,routes,riders,ridersWaiting):
+    timeTripEnded = np.frombuffer(ridersWaiting.timeTripEnded, dtype=np.int32)
+    finished = timeTripEnded > 0 #no rider arrives before 4AM, so 0 means never got off
+    trackRiderDistributions(riderStats, routes, riders['route'][finished], riders['timeArrived'][finished],
+                            np.frombuffer(ridersWaiting.timeBoarded, dtype=np.int32)[finished], timeTripEnded[finished])
+
+###########################################################
+#Runs the event loop for one or more days, generating     #
+#   riders an hour at a time as simulated time reaches    #
+#   each hour instead of the whole day up front. Riders   #
+#   are discarded once their trip is counted, so memory   #
+#   stays bounded by the riders in the system at once no  #
+#   matter how many riders or days are simulated. Results #
+#   follow the same distributions as runDay but are not   #
+#   the same draws for a given seed.                      #
+#PARAMS:                                                  #
+#   -numberOfRiders: riders to board busses each day      #
+#   -timeBetweenBus: time (in minutes) between busses of  #
+#       the same route                                    #
+#   -routes: compiled route information                   #
+#   -seed: seed for generating riders, None for a fresh   #
+#       random population                                 #
+#   -scheduler: name of the event scheduler backend       #
+#   -days: number of days to simulate                     #
+#   -checkpoint: Checkpoint to save the run to as it      #
+#       goes, None to keep no checkpoints                 #
+#RETURNS:                                                 #
+#   -busStats dictionary and riderStats dictionary,       #
+#       totalled over every day                           #
+###########################################################
+def runDayStreaming(numberOfRiders,timeBetweenBus,routes,seed=None,scheduler='bucket',days=1,checkpoint=None):
+    run = {
+        'engine': 'streaming',
+        'numberOfRiders': numberOfRiders,
+        'timeBetweenBus': timeBetweenBus,
+        'seed': seed,
+        'scheduler': scheduler,
+        'days': days,
+        'day': 0,
+        'rng': np.random.default_rng(seed),
+        'busSchedule': None, #None between days
+        'ridersWaiting': None,
+        'ridersPerHour': None,
+        'nextHour': 0,
+        'busStats': generateEmptyBusStats(routes),
+        'riderStats': generateEmptyRiderStats()
+    }
+    return runStreamingLoop(run, routes, checkpoint)
+
+###########################################################
+#Runs the days of runDayStreaming from wherever its state #
+#   is, the start of the first day or a restored          #
+#   checkpoint.                                           #
+#PARAMS:                                                  #
+#   -run: dictionary of the run's settings and state,     #
+#       updated in place                                  #
+#   -routes: compiled route information                   #
+#   -checkpoint: as for runDayStreaming                   #
+#RETURNS:                                                 #
+#   -busStats dictionary and riderStats dictionary        #
+###########################################################
+def runStreamingLoop(run,routes,checkpoint=None):
+    rng = run['rng']
+    hourShares = np.array(ARRIVAL_HOUR_SHARES)
+    busStats = run['busStats']
+    riderStats = run['riderStats']
+
+    while run['day'] < run['days']:
+        if run['busSchedule'] is None:
+            run['ridersWaiting'] = StreamingRiders(routes)
+            run['busSchedule'] = generateSchedule(run['timeBetweenBus'], routes, run['scheduler'])
+            run['ridersPerHour'] = rng.multinomial(run['numberOfRiders'], hourShares/hourShares.sum()).tolist()
+            run['nextHour'] = 0
+        ridersWaiting = run['ridersWaiting']
+        busSchedule = run['busSchedule']
+        ridersPerHour = run['ridersPerHour']
+        nextHour = run['nextHour']
+
+        while(not busSchedule.empty()):
+            nextBus = busSchedule.get()
+            #riders for an hour arrive before any bus can reach a stop in that hour
+            while(nextHour < len(ARRIVAL_HOURS) and 60*ARRIVAL_HOURS[nextHour] <= nextBus[0]):
+                ridersWaiting.add(generateRiderHour(ridersPerHour[nextHour], ARRIVAL_HOURS[nextHour], routes, rng))
+                nextHour += 1
+
+            bus = nextBus[2]
+            bus, ridersWaiting, busStats, riderStats = processStop(bus, ridersWaiting, busStats, riderStats,routes)
+
+            if(bus):
+                nextBus = (bus.nextStopTime, bus.id, bus)
+                busSchedule.put(nextBus)
+
+            if checkpoint is not None and checkpoint.due():
+                run['nextHour'] = nextHour
+                checkpoint.save(run, routes)
+
+        ridersWaiting.flush(riderStats)
+        run['day'] += 1
+        run['busSchedule'] = None
+        run['ridersWaiting'] = None
+
+    return busStats, riderStats
+
+###########################################################
+#Computes the results of a full day directly instead of   #
+#   running the event loop. Busses have no capacity and   #
+#   leave each end of their route on a fixed headway, so  #
+#   each rider boards the first bus to reach their stop   #
+#   at or after they arrive, and rides it to their end    #
+#   stop. Gives the same busStats and riderStats as       #
+#   runDay for the same seed.                             #
+#PARAMS:                                                  #
+#   -numberOfRiders: total number of riders to board      #
+#       busses throughout the day                         #
+#   -timeBetweenBus: time (in minutes) between busses of  #
+#       the same route                                    #
+#   -routes: compiled route information                   #
+#   -seed: seed for generating riders, None for a fresh   #
+#       random population                                 #
+#RETURNS:                                                 #
+#   -busStats dictionary and riderStats dictionary        #
+###########################################################
+def analyzeDay(numberOfRiders,timeBetweenBus,routes,seed=None):
+    riders = generateRiders(numberOfRiders, routes, np.random.default_rng(seed))
+    return analyzeRiders(riders, timeBetweenBus, routes)
+
+###########################################################
+#Computes busStats and riderStats for a given population  #
+#   of riders with no event loop, see analyzeDay.         #
+#PARAMS:                                                  #
+#   -riders: dictionary of rider arrays, as returned by   #
+#       generateRiders                                    #
+#   -timeBetweenBus: time (in minutes) between busses of  #
+#       the same route                                    #
+#   -routes: compiled route information                   #
+#RETURNS:                                                 #
+#   -busStats dictionary and riderStats dictionary        #
+###########################################################
+def analyzeRiders(riders,timeBetweenBus,routes):
+    busStats = generateEmptyBusStats(routes)
+    riderStats = generateEmptyRiderStats()
+    busses = (LAST_DEPARTURE - FIRST_DEPARTURE) // timeBetweenBus + 1 #busses leaving each end of a route
+
+    #sort riders by route and direction once, so each group is a slice
+    group = 2*riders['route'] + (riders['direction'] > 0)
+    order = np.argsort(group, kind='stable')
+    groupEnds = np.cumsum(np.bincount(group, minlength=2*len(routes['names']))).tolist()
+    allStarts = riders['start'][order]
+    allEnds = riders['end'][order]
+    allArrivals = riders['timeArrived'][order].astype(np.int64)
+    finished = {'route': [], 'timeArrived': [], 'timeBoarded': [], 'timeTripEnded': []}
+
+    for route, name in enumerate(routes['names']):
+        timeFromFirstStop = np.array(routes['timeFromFirstStop'][route])
+        lastStop = len(timeFromFirstStop)-1
+
+        for direction in (1, -1):
+            groupIndex = 2*route + (direction > 0)
+            riderSlice = slice(groupEnds[groupIndex-1] if groupIndex else 0, groupEnds[groupIndex])
+            start = allStarts[riderSlice]
+            end = allEnds[riderSlice]
+            timeArrived = allArrivals[riderSlice]
+
+            #stops numbered in the order this direction's busses visit them
+            if direction == 1:
+                startPosition, endPosition = start, end
+                timeFromDeparture = timeFromFirstStop
+            else:
+                startPosition, endPosition = lastStop - start, lastStop - end
+                timeFromDeparture = (timeFromFirstStop[lastStop] - timeFromFirstStop)[::-1]
+
+            #first bus reaching the rider's stop at or after they arrive
+            boardingOffset = timeFromDeparture[startPosition]
+            bus = -((FIRST_DEPARTURE + boardingOffset - timeArrived) // timeBetweenBus)
+            bus = np.maximum(bus, 0)
+            boards = bus < busses #riders arriving after the last bus never board
+            bus = bus[boards]
+            startPosition = startPosition[boards]
+            endPosition = endPosition[boards]
+            departure = FIRST_DEPARTURE + bus*timeBetweenBus
+            timeBoarded = departure + boardingOffset[boards]
+            timeTripEnded = departure + timeFromDeparture[endPosition]
+            timeArrived = timeArrived[boards]
+
+            riderStats['totalRiders'] += int(bus.size)
+            riderStats['timeWaitingForBus'] += int((timeBoarded - timeArrived).sum())
+            riderStats['timeOnBus'] += int((timeTripEnded - timeBoarded).sum())
+            riderStats['totalTime'] += int((timeTripEnded - timeArrived).sum())
+            finished['route'].append(np.full(bus.size, route))
+            finished['timeArrived'].append(timeArrived)
+            finished['timeBoarded'].append(timeBoarded)
+            finished['timeTripEnded'].append(timeTripEnded)
+
+            #riders on each bus between each pair of stops, from a running
+            #   sum of +1 where riders board and -1 where they get off
+            stopCount = lastStop + 1
+            change = np.bincount(bus*stopCount + startPosition, minlength=busses*stopCount)
+            change -= np.bincount(bus*stopCount + endPosition, minlength=busses*stopCount)
+            load = change.reshape(busses, stopCount).cumsum(axis=1)[:, :lastStop]
+            segmentTime = np.diff(timeFromDeparture)
+
+            busStats[name]['totalBusses'] += busses
+            busStats[name]['totalRiders'] += int(bus.size)
+            busStats[name]['timeEmpty'] += int(((load == 0) * segmentTime).sum())
+            busStats[name]['timeRunning'] += busses * int(timeFromDeparture[lastStop])
+            if load.size and busStats[name]['mostRiders'] < int(load.max()):
+                busStats[name]['mostRiders'] = int(load.max())
+            peakLoads = load.max(axis=1) if load.size else np.zeros(busses, dtype=np.int64)
+            addBinCounts(busStats[name]['peakLoads'], np.bincount(histogramBins(peakLoads)))
+
+    trackRiderDistributions(riderStats, routes, *[np.concatenate(finished[column]) for column in
+                                                  ('route', 'timeArrived', 'timeBoarded', 'timeTripEnded')])
+    return busStats, riderStats
+
+###########################################################
+#Finds the riders of each route who arrive at their stop  #
+#   after the last bus of the day has passed it, and so   #
+#   never board. Uses the same rule as analyzeRiders: a   #
+#   bus picks up riders who arrived by the minute it      #
+#   reaches their stop.                                   #
+#PARAMS:                                                  #
+#   -riders: dictionary of rider arrays from              #
+#       generateRiders                                    #
+#   -timeBetweenBus: time (in minutes) between busses     #
+#   -routes: compiled route information                   #
+#RETURNS:                                                 #
+#   -Dictionary keyed by route name of (riders left       #
+#       behind, minutes they wait for the next day's      #
+#       first bus to reach their stop)                    #
+###########################################################
+def findRidersLeftBehind(riders,timeBetweenBus,routes):
+    lastDeparture = FIRST_DEPARTURE + (LAST_DEPARTURE - FIRST_DEPARTURE) // timeBetweenBus * timeBetweenBus
+    leftBehind = {}
+    for route, name in enumerate(routes['names']):
+        timeFromFirstStop = np.array(routes['timeFromFirstStop'][route])
+        onRoute = riders['route'] == route
+        start = riders['start'][onRoute]
+        #minutes from a bus leaving its first stop to reaching the rider's stop, either direction
+        boardingOffset = np.where(riders['direction'][onRoute] > 0, timeFromFirstStop[start],
+                                  timeFromFirstStop[-1] - timeFromFirstStop[start])
+        timeArrived = riders['timeArrived'][onRoute].astype(np.int64)
+        left = timeArrived > lastDeparture + boardingOffset
+        nextBus = 24*60 + FIRST_DEPARTURE + boardingOffset[left]
+        leftBehind[name] = (int(left.sum()), int((nextBus - timeArrived[left]).sum()))
+
+    return leftBehind
+
+
+###########################################################
+#Cross-validates the analytic engine against the event    #
+#   loop by running both on the same riders.              #
+#PARAMS:                                                  #
+#   -riderLevels: list of daily ridership levels          #
+#   -headways: list of times (in minutes) between busses  #
+#   -routes: compiled route information                   #
+#   -seed: seed for generating riders                     #
+#RETURNS:                                                 #
+#   -List of (riders, headway) cells where the two        #
+#       engines disagree, empty if they all agree         #
+###########################################################
+def validateEngines(riderLevels,headways,routes,seed=0):
+    mismatches = []
+    for riders in riderLevels:
+        for minutes in headways:
+            cell = cellSeed(seed, riders, minutes)
+            if runDay(riders, minutes, routes, cell) != analyzeDay(riders, minutes, routes, cell):
+                mismatches.append((riders, minutes))
+
+    return mismatches
+
+###########################################################
+#Derives the seed for one cell of the parameter sweep so  #
+#   that it depends only on the master seed and the cell, #
+#   not on the order cells are run in.                    #
+#PARAMS:                                                  #
+#   -masterSeed: int seed for the whole sweep             #
+#   -numberOfRiders: riders in the cell                   #
+#   -timeBetweenBus: headway (in minutes) of the cell     #
+#RETURNS:                                                 #
+#   -int seed for the cell                                #
+###########################################################
+def cellSeed(masterSeed,numberOfRiders,timeBetweenBus):
+    seedSequence = np.random.SeedSequence([masterSeed, numberOfRiders, timeBetweenBus])
+    return int(seedSequence.generate_state(1)[0])
+
+###########################################################
+#Runs one cell of the parameter sweep. Kept at module     #
+#   level so worker processes can pickle it.              #
+#PARAMS:                                                  #
+#   -cell: dictionary with the cell's 'riders',           #
+#       'minutes', 'routes', 'seed', 'scheduler', 'engine' #
+#       'workers' (shards for the sharded engine),        #
+#       'checkpoint' (directory to keep checkpoints in,   #
+#       None for none), 'checkpointEvery', 'days' (days   #
+#       for the streaming engine to run),                 #
+#       'profile' (True to instrument the run) and        #
+#       'details' (True to keep per rider and bus detail) #
+#   -pool: ProcessPoolExecutor for the sharded engine to  #
+#       run its shards in                                 #
+#RETURNS:                                                 #
+#   -Dictionary with the cell's riders, minutes, seed,    #
+#       busStats and riderStats, and profile report and   #
+#       details if they were asked for                    #
+###########################################################
+def runSweepCell(cell,pool=None):
+    numberOfRiders = cell['riders']
+    timeBetweenBus = cell['minutes']
+    routes = cell['routes']
+    seed = cell['seed']
+    profile = Profiler() if cell['profile'] else None
+    details = {} if cell['details'] else None
+    if cell['engine'] == 'analytic':
+        busStats, riderStats = analyzeDay(numberOfRiders, timeBetweenBus, routes, seed)
+    elif cell['engine'] == 'sharded':
+        busStats, riderStats = runDaySharded(numberOfRiders, timeBetweenBus, routes, seed, cell['scheduler'],
+                                             cell['workers'], pool)
+    elif cell['checkpoint'] is not None:
+        #named by the result cache key, so a checkpoint is only picked up by the same cell
+        path = os.path.join(cell['checkpoint'], resultKey(numberOfRiders, timeBetweenBus, seed, cell['engine'], routes,
+                                                          cell['days']) + ".checkpoint")
+        checkpoint = Checkpoint(path, cell['checkpointEvery'])
+        if os.path.exists(path):
+            busStats, riderStats = resumeRun(path, routes, details, checkpoint)
+        elif cell['engine'] == 'streaming':
+            busStats, riderStats = runDayStreaming(numberOfRiders, timeBetweenBus, routes, seed, cell['scheduler'],
+                                                   cell['days'], checkpoint)
+        else:
+            busStats, riderStats = runDay(numberOfRiders, timeBetweenBus, routes, seed, cell['scheduler'],
+                                          profile, details, checkpoint)
+        #the finished cell is in the results now, so its checkpoint is no longer needed
+        if os.path.exists(path):
+            os.remove(path)
+    elif cell['engine'] == 'streaming':
+        busStats, riderStats = runDayStreaming(numberOfRiders, timeBetweenBus, routes, seed, cell['scheduler'],
+                                               cell['days'])
+    else:
+        busStats, riderStats = runDay(numberOfRiders, timeBetweenBus, routes, seed, cell['scheduler'], profile, details)
+
+    result = {
+        'riders': numberOfRiders,
+        'minutes': timeBetweenBus,
+        'seed': seed,
+        'busStats': busStats,
+        'riderStats': riderStats
+    }
+    if profile is not None:
+        result['profile'] = profile.report()
+    if details is not None:
+        result['details'] = details
+
+    return result
+
+###########################################################
+#Runs every (riders, headway) cell of a parameter sweep,  #
+#   fanning cells out over a pool of worker processes.    #
+#PARAMS:                                                  #
+#   -riderLevels: list of daily ridership levels          #
+#   -headways: list of times (in minutes) between busses  #
+#   -routes: compiled route information                   #
+#   -masterSeed: int seed every cell's seed comes from    #
+#   -workers: number of worker processes, 1 runs every    #
+#       cell in this process                              #
+#   -scheduler: name of the event scheduler backend       #
+#   -engine: 'events' to run the event loop, 'sharded' to #
+#       use runDaySharded, running cells one at a time    #
+#       with each day's routes split over the workers,    #
+#       'streaming' to use runDayStreaming, 'analytic' to #
+#       use analyzeDay                                    #
+#   -profile: True to instrument each cell's event loop   #
+#   -details: True to keep each cell's per rider and bus  #
+#       detail records                                    #
+#   -cache: ResultCache to take finished cells from and   #
+#       save new ones to, None to run every cell. Cells   #
+#       that are profiled or keep details always run.     #
+#   -checkpoint: directory to checkpoint each cell's run  #
+#       in, and resume an interrupted cell's run from,    #
+#       None to keep no checkpoints                       #
+#   -checkpointEvery: events between checkpoints          #
+#   -days: days each cell runs with the streaming engine  #
+#RETURNS:                                                 #
+#   -List of cell results from runSweepCell, ordered by   #
+#       riders then headway regardless of which worker    #
+#       finished first                                    #
+###########################################################
+def runSweep(riderLevels,headways,routes,masterSeed,workers=1,scheduler='bucket',engine='events',profile=False,details=False,cache=None,
+             checkpoint=None,checkpointEvery=200000,days=1):
+    if profile or details:
+        cache = None
+
+    cells = []
+    for riders in riderLevels:
+        for minutes in headways:
+            cells.append({
+                'riders': riders,
+                'minutes': minutes,
+                'routes': routes,
+                'seed': cellSeed(masterSeed, riders, minutes),
+                'scheduler': scheduler,
+                'engine': engine,
+                'workers': workers,
+                'checkpoint': checkpoint,
+                'checkpointEvery': checkpointEvery,
+                'days': days,
+                'profile': profile,
+                'details': details
+            })
+
+    results = [None] * len(cells)
+    keys = [None] * len(cells)
+    toRun = []
+    for i, cell in enumerate(cells):
+        if cache is not None:
+            keys[i] = resultKey(cell['riders'], cell['minutes'], cell['seed'], engine, routes, days)
+            saved = cache.get(keys[i])
+            if saved is not None:
+                results[i] = {'riders': cell['riders'], 'minutes': cell['minutes'], 'seed': cell['seed'],
+                              'busStats': saved['busStats'], 'riderStats': saved['riderStats']}
+                continue
+        toRun.append(i)
+
+    #each cell is saved as soon as it finishes, so an interrupted sweep keeps its finished cells
+    def finish(i, result):
+        results[i] = result
+        if cache is not None:
+            cache.put(keys[i], {'busStats': result['busStats'], 'riderStats': result['riderStats']})
+
+    if workers <= 1 or (len(toRun) <= 1 and engine != 'sharded'):
+        for i in toRun:
+            finish(i, runSweepCell(cells[i]))
+        return results
+
+    if engine == 'sharded':
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for i in toRun:
+                finish(i, runSweepCell(cells[i], pool))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(runSweepCell, cells[i]): i for i in toRun}
+        for future in as_completed(futures):
+            finish(futures[future], future.result())
+    return results
+
+###########################################################
+#Runs replications of every headway at one ridership      #
+#   level until the confidence interval on each cell's    #
+#   mean wait is narrow enough. Each replication draws    #
+#   one rider population and runs every headway still     #
+#   short of the target on it, so headways are compared   #
+#   on the same riders (common random numbers) and        #
+#   riders are generated once per replication rather than #
+#   once per cell. With antithetic draws each replication #
+#   also runs the population made from 1 - the uniforms,  #
+#   and the pair's average counts as one observation.     #
+#PARAMS:                                                  #
+#   -numberOfRiders: riders in the day                    #
+#   -headways: list of times (in minutes) between busses  #
+#   -routes: compiled route information                   #
+#   -seed: seed for the level's rider populations         #
+#   -targetWidth: widest 95% confidence interval (in      #
+#       minutes) allowed on a cell's mean wait            #
+#   -antithetic: True to pair each population with its    #
+#       antithetic twin                                   #
+#   -minReplications, maxReplications: fewest and most    #
+#       observations of a cell                            #
+#   -scheduler: name of the event scheduler backend       #
+#   -engine: 'events' or 'analytic'                       #
+#RETURNS:                                                 #
+#   -List of cell results, one per headway, like those of #
+#       runSweepCell with stats added up over every day   #
+#       run, plus 'days' simulated, 'replications'        #
+#       (observations), 'meanWait' and 'waitHalfWidth',   #
+#       half the width of its confidence interval         #
+###########################################################
+def replicateLevel(numberOfRiders,headways,routes,seed,targetWidth,antithetic=False,minReplications=3,
+                   maxReplications=100,scheduler='bucket',engine='events'):
+    rng = np.random.default_rng(seed)
+    cells = {}
+    for minutes in headways:
+        cells[minutes] = {
+            'riders': numberOfRiders,
+            'minutes': minutes,
+            'seed': seed,
+            'busStats': generateEmptyBusStats(routes),
+            'riderStats': generateEmptyRiderStats(),
+            'days': 0,
+            'waits': []
+        }
+
+    active = list(headways)
+    while active:
+        uniforms = rng.random((5, numberOfRiders))
+        populations = [generateRidersFromUniforms(uniforms, routes)]
+        if antithetic:
+            populations.append(generateRidersFromUniforms(1 - uniforms, routes))
+
+        for minutes in active:
+            cell = cells[minutes]
+            waits = []
+            for riders in populations:
+                if engine == 'analytic':
+                    busStats, riderStats = analyzeRiders(riders, minutes, routes)
+                else:
+                    busStats, riderStats = runShard(riders, minutes, routes, None, scheduler)
+                mergeBusStats(cell['busStats'], busStats)
+                mergeRiderStats(cell['riderStats'], riderStats)
+                cell['days'] += 1
+                waits.append(riderStats['timeWaitingForBus'] / max(riderStats['totalRiders'], 1))
+            cell['waits'].append(sum(waits) / len(waits))
+
+        stillActive = []
+        for minutes in active:
+            waits = cells[minutes]['waits']
+            if len(waits) < maxReplications and (len(waits) < minReplications or
+                                                 2*meanConfidenceInterval(waits)[1] > targetWidth):
+                stillActive.append(minutes)
+        active = stillActive
+
+    results = []
+    for minutes in headways:
+        cell = cells[minutes]
+        cell['replications'] = len(cell['waits'])
+        cell['meanWait'], cell['waitHalfWidth'] = meanConfidenceInterval(cell.pop('waits'))
+        results.append(cell)
+
+    return results
+
+#two-sided 95% quantiles of Student's t distribution by degrees of freedom, 1.96 past the end
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+        2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+###########################################################
+#Mean of a list of independent observations and half the  #
+#   width of its 95% confidence interval, infinite for    #
+#   fewer than two observations                           #
+###########################################################
+def meanConfidenceInterval(values):
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, float('inf')
+    variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+    degrees = len(values) - 1
+    t = T_95[degrees-1] if degrees <= len(T_95) else 1.96
+    return mean, t * (variance / len(values)) ** 0.5
+
+###########################################################
+#Runs replicateLevel for every ridership level, fanning    #
+#   levels out over a pool of worker processes            #
+#PARAMS:                                                  #
+#   -riderLevels: list of daily ridership levels          #
+#   -masterSeed: int seed every level's seed comes from   #
+#   -workers: number of worker processes                  #
+#   -the rest: as for replicateLevel                      #
+#RETURNS:                                                 #
+#   -List of cell results, ordered by riders then headway #
+###########################################################
+def runReplications(riderLevels,headways,routes,masterSeed,targetWidth,workers=1,antithetic=False,
+                    minReplications=3,maxReplications=100,scheduler='bucket',engine='events'):
+    #headway 0 never occurs in a sweep, so level seeds never collide with cellSeed's
+    levels = [(riders, headways, routes, cellSeed(masterSeed, riders, 0), targetWidth, antithetic, minReplications,
+               maxReplications, scheduler, engine) for riders in riderLevels]
+    if workers <= 1:
+        results = [replicateLevel(*level) for level in levels]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(replicateLevel, *zip(*levels)))
+
+    return [cell for level in results for cell in level]
+
+###########################################################
+#Searches for the best headway of each route, trading     #
+#   rider wait time against bus hours. Riders never       #
+#   transfer, so a route's wait and bus hours depend only #
+#   on its own headway and the search splits into one     #
+#   search per route. Every simulation uses the same      #
+#   seed, so each headway is tried on the very same       #
+#   riders (common random numbers), and one simulation at #
+#   a headway scores it for every route at once.          #
+#   Bus counts are whole, so a route's cost is not smooth #
+#   in its headway and the search is an exhaustive scan:  #
+#   every headway is simulated once and each route and    #
+#   weight picks its cheapest. Riders arriving after a    #
+#   route's last bus has passed their stop count as       #
+#   waiting for the next day's first bus, so a headway    #
+#   can not save bus hours by leaving them behind.        #
+#PARAMS:                                                  #
+#   -numberOfRiders: riders in the day                    #
+#   -routes: compiled route information                   #
+#   -seed: seed for generating riders                     #
+#   -headways: increasing headways (in minutes) to pick   #
+#       from                                              #
+#   -weights: minutes of rider waiting worth one bus      #
+#       minute, one plan is searched for per weight       #
+#   -engine: 'analytic' or 'events'                       #
+#RETURNS:                                                 #
+#   -Dictionary with 'frontier', the plans no other plan  #
+#       beats on both wait and bus hours, ordered by bus  #
+#       hours, each with its 'weight', 'headways' by      #
+#       route name, 'waitHours' (including riders left    #
+#       behind), 'ridersLeftBehind', 'busHours' and       #
+#       'emptyBusHours', and 'simulations', the number of #
+#       days simulated                                    #
+###########################################################
+def optimizeHeadways(numberOfRiders,routes,seed,headways=range(5, 61),weights=None,engine='analytic'):
+    headways = list(headways)
+    if weights is None:
+        weights = np.geomspace(1, 1000, 10).tolist()
+    simulate = analyzeDay if engine == 'analytic' else runDay
+    #the riders every simulation generates from the seed
+    riders = generateRiders(numberOfRiders, routes, np.random.default_rng(seed))
+
+    #minutes waited, bus minutes, empty bus minutes and riders left behind of each route, by headway
+    scores = {}
+    def score(headway):
+        if headway not in scores:
+            busStats, riderStats = simulate(numberOfRiders, headway, routes, seed)
+            byRoute = riderStats['distributions']['timeWaitingForBus']['byRoute']
+            leftBehind = findRidersLeftBehind(riders, headway, routes)
+            scores[headway] = {name: (histogramTotal(byRoute.get(name, [])) + leftBehind[name][1],
+                                      busStats[name]['timeRunning'], busStats[name]['timeEmpty'],
+                                      leftBehind[name][0]) for name in routes['names']}
+        return scores[headway]
+
+    plans = []
+    for weight in weights:
+        plan = {}
+        for name in routes['names']:
+            def cost(headway):
+                wait, busMinutes, _, _ = score(headway)[name]
+                return wait + weight*busMinutes
+            plan[name] = min(headways, key=cost)
+        plans.append((weight, plan))
+
+    frontier = []
+    for weight, plan in plans:
+        totals = [sum(score(plan[name])[name][i] for name in routes['names']) / 60 for i in range(3)]
+        frontier.append({'weight': weight, 'headways': plan, 'waitHours': totals[0], 'busHours': totals[1],
+                         'emptyBusHours': totals[2],
+                         'ridersLeftBehind': sum(score(plan[name])[name][3] for name in routes['names'])})
+    frontier.sort(key=lambda plan: (plan['busHours'], plan['waitHours']))
+    #keep plans with less waiting than every plan using fewer bus hours, dropping repeats
+    pareto = []
+    for plan in frontier:
+        if not pareto or plan['waitHours'] < pareto[-1]['waitHours'] and plan['busHours'] > pareto[-1]['busHours']:
+            pareto.append(plan)
+
+    return {
+        'frontier': pareto,
+        'simulations': len(scores)
+    }
+
+###########################################################
+#Makes an optimizer result into a string for printing     #
+#PARAMS:                                                  #
+#   -result: dictionary from optimizeHeadways             #
+#   -routes: compiled route information                   #
+#RETURNS:                                                 #
+#   -String of the frontier in readable format            #
+###########################################################
+def printFrontier(result, routes):
+    log = "Headway Frontier:\n"
+    for plan in result['frontier']:
+        log += "\tWeight " + str(round(plan['weight'], 3)) + ": " + str(round(plan['busHours'])) + " bus hours ("
+        log += str(round(plan['emptyBusHours'])) + " empty), " + str(round(plan['waitHours'])) + " hours waiting, "
+        log += str(plan['ridersLeftBehind']) + " riders left behind\n"
+        log += "\t\t" + ", ".join("Route " + name + " every " + str(plan['headways'][name]) + "m"
+                                   for name in routes['names']) + "\n"
+    log += "Simulated " + str(result['simulations']) + " days, one per headway\n"
+
+    return log
+
+###########################################################
+#Makes the result cache key of one day. It covers every   #
+#   input that changes a day's results, including the     #
+#   contents of the route file, so editing routes.json or #
+#   bumping ENGINE_VERSION never reuses stale results.    #
+#PARAMS:                                                  #
+#   -numberOfRiders: riders in the day                    #
+#   -timeBetweenBus: headway (in minutes) of the day      #
+#   -seed: seed the day's riders were generated from      #
+#   -engine: name of the engine that ran the day          #
+#   -routes: compiled routes from loadRoutes              #
+#   -days: days the streaming engine ran                  #
+#RETURNS:                                                 #
+#   -Hex string key                                       #
+###########################################################
+def resultKey(numberOfRiders,timeBetweenBus,seed,engine,routes,days=1):
+    inputs = [numberOfRiders, timeBetweenBus, seed, engine, ENGINE_VERSION, routes['digest']]
+    #single days keep the keys they had before runs could be longer
+    if days != 1:
+        inputs.append(days)
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+###########################################################
+#On disk cache of day results, one JSON file per key in a #
+#   directory. When the files add up to more than         #
+#   maxBytes, the least recently used are deleted until   #
+#   they fit again. Files are written to a temporary name #
+#   and renamed into place, so a run killed partway never #
+#   leaves a half written result behind; temporary files  #
+#   left by such a run are deleted when the cache is      #
+#   next opened.                                          #
+###########################################################
+class ResultCache:
+    __slots__ = ('directory', 'maxBytes', 'sizes', 'totalBytes', 'hits', 'misses')
+
+    def __init__(self, directory, maxBytes=64*1024*1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.sizes = {}
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".json"):
+                self.sizes[entry.name[:-len(".json")]] = entry.stat().st_size
+            elif entry.name.endswith(".tmp"):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        self.totalBytes = sum(self.sizes.values())
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    #returns the saved result, or None if there is none
+    def get(self, key):
+        if key not in self.sizes:
+            self.misses += 1
+            return None
+        try:
+            f = open(self.path(key))
+            result = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            self.forget(key)
+            self.misses += 1
+            return None
+        #modification time stands in for last use when choosing what to evict
+        os.utime(self.path(key))
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        temporaryPath = self.path(key) + "." + str(os.getpid()) + ".tmp"
+        f = open(temporaryPath, "w")
+        json.dump(result, f)
+        f.close()
+        os.replace(temporaryPath, self.path(key))
+
+        self.totalBytes -= self.sizes.get(key, 0)
+        self.sizes[key] = os.path.getsize(self.path(key))
+        self.totalBytes += self.sizes[key]
+        self.evict(key)
+
+    #deletes least recently used results other than keep until the cache fits
+    def evict(self, keep=None):
+        if self.totalBytes <= self.maxBytes:
+            return
+        lastUsed = []
+        for key in self.sizes:
+            if key != keep:
+                try:
+                    lastUsed.append((os.path.getmtime(self.path(key)), key))
+                except OSError:
+                    lastUsed.append((0, key))
+        lastUsed.sort()
+        for _, key in lastUsed:
+            if self.totalBytes <= self.maxBytes:
+                break
+            self.forget(key)
+
+    def forget(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+        self.totalBytes -= self.sizes.pop(key, 0)
+
+###########################################################
+#Saves the full state of a runDay or runDayStreaming run  #
+#   to one file every so many events, so a crashed run    #
+#   can carry on with resumeRun. The file is a pickle     #
+#   compressed with zlib and is replaced atomically, so   #
+#   it always holds a complete snapshot. runDay's riders  #
+#   are not saved, since resumeRun generates the same     #
+#   riders again from the seed; only what the event loop  #
+#   changes is. Busses are saved as plain tuples, so a    #
+#   checkpoint written by "python bussimulation.py" can   #
+#   be resumed after "import bussimulation".              #
+###########################################################
+class Checkpoint:
+    __slots__ = ('path', 'every', 'eventsLeft', 'saves')
+
+    def __init__(self, path, every=200000):
+        self.path = path
+        self.every = every
+        self.eventsLeft = every
+        self.saves = 0
+
+    #counts an event, True once every 'every' events
+    def due(self):
+        self.eventsLeft -= 1
+        if self.eventsLeft > 0:
+            return False
+        self.eventsLeft = self.every
+        return True
+
+    def save(self, run, routes):
+        snapshot = dict(run)
+        snapshot['version'] = ENGINE_VERSION
+        snapshot['routesDigest'] = routes.get('digest')
+        snapshot['every'] = self.every
+        schedule = run['busSchedule']
+        if schedule is not None:
+            events = list(schedule.queue) if isinstance(schedule, PriorityQueue) else schedule.pending()
+            snapshot['busSchedule'] = [(t, busId, busState(bus)) for t, busId, bus in events]
+        if run.get('finishedBusses') is not None:
+            snapshot['finishedBusses'] = [busState(bus) for bus in run['finishedBusses']]
+        if run['engine'] == 'events':
+            ridersWaiting = run['ridersWaiting']
+            snapshot['ridersWaiting'] = {name: getattr(ridersWaiting, name) for name in
+                                         ('queues', 'timeBoarded', 'timeTripEnded', 'boardedCount', 'disboardedCount')}
+        else:
+            snapshot['rng'] = run['rng'].bit_generator.state
+            if run['ridersWaiting'] is not None:
+                snapshot['ridersWaiting'] = {name: getattr(run['ridersWaiting'], name) for name in
+                                             StreamingRiders.__slots__ if name != 'routes'}
+
+        temporaryPath = self.path + "." + str(os.getpid()) + ".tmp"
+        f = open(temporaryPath, "wb")
+        f.write(zlib.compress(pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL), 1))
+        f.close()
+        os.replace(temporaryPath, self.path)
+        self.saves += 1
+
+#a bus's attributes as a tuple in Bus.__slots__ order, which pickles without naming the Bus class
+def busState(bus):
+    return tuple(getattr(bus, name) for name in Bus.__slots__)
+
+def restoreBus(state):
+    bus = Bus.__new__(Bus)
+    for name, value in zip(Bus.__slots__, state):
+        setattr(bus, name, value)
+    return bus
+
+###########################################################
+#Carries on a run from the last snapshot its Checkpoint   #
+#   saved, giving the same results as if it had never     #
+#   stopped                                               #
+#PARAMS:                                                  #
+#   -path: checkpoint file                                #
+#   -routes: compiled routes the run was started with     #
+#   -details: dictionary to fill in as for runDay, only   #
+#       if the run was started keeping details            #
+#   -checkpoint: Checkpoint to keep saving the run to, by #
+#       default the same file at the same interval        #
+#RETURNS:                                                 #
+#   -busStats dictionary and riderStats dictionary        #
+###########################################################
+def resumeRun(path,routes,details=None,checkpoint=None):
+    f = open(path, "rb")
+    snapshot = pickle.loads(zlib.decompress(f.read()))
+    f.close()
+    if snapshot['version'] != ENGINE_VERSION:
+        raise ValueError(path + " was saved by engine version " + str(snapshot['version']))
+    if snapshot['routesDigest'] != routes.get('digest'):
+        raise ValueError(path + " was saved with different routes")
+    if checkpoint is None:
+        checkpoint = Checkpoint(path, snapshot['every'])
+
+    run = dict(snapshot)
+    for key in ('version', 'routesDigest', 'every'):
+        del run[key]
+    if run['busSchedule'] is not None:
+        run['busSchedule'] = SCHEDULERS[run['scheduler']]()
+        for t, busId, state in snapshot['busSchedule']:
+            run['busSchedule'].put((t, busId, restoreBus(state)))
+    if run.get('finishedBusses') is not None:
+        run['finishedBusses'] = [restoreBus(state) for state in snapshot['finishedBusses']]
+
+    if run['engine'] == 'events':
+        if details is not None and run['finishedBusses'] is None:
+            raise ValueError(path + " was saved from a run that kept no details")
+        riders = generateRiders(run['numberOfRiders'], routes, np.random.default_rng(run['seed']))
+        run['ridersWaiting'] = buildWaitingIndex(riders)
+        for name, value in snapshot['ridersWaiting'].items():
+            setattr(run['ridersWaiting'], name, value)
+        return runEventLoop(run, riders, routes, None, details, checkpoint)
+
+    run['rng'] = np.random.default_rng()
+    run['rng'].bit_generator.state = snapshot['rng']
+    if snapshot['ridersWaiting'] is not None:
+        run['ridersWaiting'] = StreamingRiders(routes)
+        for name, value in snapshot['ridersWaiting'].items():
+            setattr(run['ridersWaiting'], name, value)
+    return runStreamingLoop(run, routes, checkpoint)
+
+###########################################################
+#Opt-in instrumentation for a single run. Records wall    #
+#   time spent in each phase of the run, counters for the #
+#   event loop, and a timeline of schedule queue depth    #
+#   and riders waiting, sampled once per simulated minute #
+#   that has an event. The event loop only touches it     #
+#   when one is passed in, so runs without it pay two     #
+#   None checks per event.                                #
+###########################################################
+class Profiler:
+    __slots__ = ('phases', 'phaseName', 'phaseStart', 'events', 'ridersScanned', 'mostRidersScanned',
+                 'timeline', 'lastMinute')
+
+    def __init__(self):
+        self.phases = {}
+        self.phaseName = None
+        self.phaseStart = 0
+        self.events = 0
+        self.ridersScanned = 0
+        self.mostRidersScanned = 0
+        self.timeline = []
+        self.lastMinute = -1
+
+    #ends the current phase, if any, and starts timing the named one
+    def startPhase(self, name):
+        self.endPhase()
+        self.phaseName = name
+        self.phaseStart = time.perf_counter()
+
+    def endPhase(self):
+        if self.phaseName is not None:
+            elapsed = time.perf_counter() - self.phaseStart
+            self.phases[self.phaseName] = self.phases.get(self.phaseName, 0) + elapsed
+            self.phaseName = None
+
+    #records one stop visit that boarded or disboarded scanned riders
+    def recordEvent(self, t, queueDepth, ridersWaiting, scanned):
+        self.events += 1
+        self.ridersScanned += scanned
+        if scanned > self.mostRidersScanned:
+            self.mostRidersScanned = scanned
+        if t != self.lastMinute:
+            self.timeline.append((t, queueDepth, ridersWaiting.waitingCount(t)))
+            self.lastMinute = t
+
+    #returns everything recorded as a dictionary that can be written as JSON
+    def report(self):
+        self.endPhase()
+        return {
+            'phases': dict(self.phases),
+            'events': self.events,
+            'ridersScanned': self.ridersScanned,
+            'ridersScannedPerStop': self.ridersScanned / self.events if self.events else 0,
+            'mostRidersScannedAtOneStop': self.mostRidersScanned,
+            'timeline': [{'time': t, 'queueDepth': depth, 'ridersWaiting': waiting}
+                         for t, depth, waiting in self.timeline]
+        }
+
+###########################################################
+#Writes a profiling report to a JSON file, and its        #
+#   timeline to a CSV file of the same name               #
+#PARAMS:                                                  #
+#   -report: dictionary from Profiler.report              #
+#   -path: path of the JSON file, ending in .json         #
+###########################################################
+def writeProfile(report, path):
+    f = open(path, "w")
+    json.dump(report, f, indent=4)
+    f.close()
+
+    f = open(path[:-len(".json")] + "_timeline.csv", "w")
+    f.write("time,queueDepth,ridersWaiting\n")
+    for sample in report['timeline']:
+        f.write(str(sample['time']) + "," + str(sample['queueDepth']) + "," + str(sample['ridersWaiting']) + "\n")
+    f.close()
 
 ###########################################################
 #Loads route data from json file                          #
@@ -320,26 +2059,214 @@ def loadRouteData(pathToRouteData):
     f.close()
     return routeData
 
-def generateEmptyBusStats(routeData):
+###########################################################
+#Compiles route data into integer lookup tables so the    #
+#   event loop never has to search a route's stop list.   #
+#   Stops on a route are referred to by their index along #
+#   the route, and every stop in the network is also      #
+#   given an integer id.                                  #
+#PARAMS:                                                  #
+#   -routeData: dictionary of route data, as returned by  #
+#       loadRouteData                                     #
+#RETURNS:                                                 #
+#   -Dictionary of lists indexed by route number:         #
+#       'names', 'ridershipShare', 'stops' (stop ids      #
+#       along the route), and 'nextStop', 'travelTime'    #
+#       and 'isFinal', each a dictionary keyed by         #
+#       direction of lists indexed by stop on the route,  #
+#       and 'timeFromFirstStop' from routes.json.         #
+#       'stopNames' and 'stopIds' map stop ids to names   #
+#       and back.                                         #
+###########################################################
+def compileRoutes(routeData):
+    routes = {
+        'names': [],
+        'ridershipShare': [],
+        'stops': [],
+        'nextStop': [],
+        'travelTime': [],
+        'isFinal': [],
+        'timeFromFirstStop': [],
+        'stopNames': [],
+        'stopIds': {}
+    }
+
+    for name in routeData:
+        stops = []
+        for stopName in routeData[name]['stops']:
+            if stopName not in routes['stopIds']:
+                routes['stopIds'][stopName] = len(routes['stopNames'])
+                routes['stopNames'].append(stopName)
+            stops.append(routes['stopIds'][stopName])
+
+        timeFromFirstStop = routeData[name]['timeFromFirstStop']
+        lastStop = len(stops)-1
+        nextStop = {1: [], -1: []}
+        travelTime = {1: [], -1: []}
+        isFinal = {1: [], -1: []}
+        for stop in range(len(stops)):
+            for direction in (1, -1):
+                final = (direction == 1 and stop == lastStop) or (direction == -1 and stop == 0)
+                isFinal[direction].append(final)
+                if final:
+                    nextStop[direction].append(-1)
+                    travelTime[direction].append(0)
+                else:
+                    nextStop[direction].append(stop+direction)
+                    travelTime[direction].append((timeFromFirstStop[stop+direction] - timeFromFirstStop[stop]) * direction)
+
+        routes['names'].append(name)
+        routes['ridershipShare'].append(routeData[name]['ridershipShare'])
+        routes['stops'].append(stops)
+        routes['nextStop'].append(nextStop)
+        routes['travelTime'].append(travelTime)
+        routes['isFinal'].append(isFinal)
+        routes['timeFromFirstStop'].append(timeFromFirstStop)
+
+    return routes
+
+###########################################################
+#Loads and compiles route data, reusing the compiled      #
+#   routes for every later call with the same path.       #
+#PARAMS:                                                  #
+#   -pathToRouteData: string representing path to json    #
+#       file containing necessary data                    #
+#RETURNS:                                                 #
+#   -Compiled routes, as returned by compileRoutes, with  #
+#       'digest', a hash of the file's contents. These    #
+#       are shared between callers and must not be        #
+#       modified. Paths ending in ROUTE_CACHE_SUFFIX are  #
+#       read with loadRouteCache, anything else as JSON.  #
+###########################################################
+@functools.lru_cache(maxsize=None)
+def loadRoutes(pathToRouteData):
+    if pathToRouteData.endswith(ROUTE_CACHE_SUFFIX):
+        routes = compileRoutes(loadRouteCache(pathToRouteData))
+    else:
+        routes = compileRoutes(loadRouteData(pathToRouteData))
+    f = open(pathToRouteData, "rb")
+    routes['digest'] = hashlib.sha256(f.read()).hexdigest()
+    f.close()
+    return routes
+
+#binary route files start with ROUTE_CACHE_MAGIC, then the header length and a
+#   JSON header, then each array aligned to 8 bytes where the header says it is
+ROUTE_CACHE_SUFFIX = ".routes"
+ROUTE_CACHE_MAGIC = b"RTDROUTE\x01\x00\x00\x00"
+
+###########################################################
+#Writes route data to a compact binary file that can be   #
+#   memory-mapped. Names are kept in a small JSON header  #
+#   and stops, times and shares in flat NumPy arrays, so  #
+#   a network of thousands of stops loads without parsing #
+#   a large text file.                                    #
+#PARAMS:                                                  #
+#   -routeData: dictionary of route data, as returned by  #
+#       loadRouteData                                     #
+#   -path: file to write, ending in ROUTE_CACHE_SUFFIX    #
+###########################################################
+def writeRouteCache(routeData, path):
+    routes = compileRoutes(routeData)
+    arrays = {
+        'stopOffsets': np.cumsum([0] + [len(stops) for stops in routes['stops']]).astype(np.int64),
+        'stops': np.array([stop for stops in routes['stops'] for stop in stops], dtype=np.int32),
+        'timeFromFirstStop': np.array([t for times in routes['timeFromFirstStop'] for t in times], dtype=np.int32),
+        'ridershipShare': np.array(routes['ridershipShare'], dtype=np.float64)
+    }
+
+    header = {'names': routes['names'], 'stopNames': routes['stopNames'], 'arrays': {}}
+    #offsets depend on the header length, so lay the arrays out until the header stops growing
+    headerBytes = b""
+    while True:
+        offset = len(ROUTE_CACHE_MAGIC) + 8 + len(headerBytes)
+        for name, values in arrays.items():
+            offset += -offset % 8
+            header['arrays'][name] = [offset, values.dtype.str, len(values)]
+            offset += values.nbytes
+        newHeaderBytes = json.dumps(header).encode()
+        done = len(newHeaderBytes) == len(headerBytes)
+        headerBytes = newHeaderBytes
+        if done:
+            break
+
+    f = open(path, "wb")
+    f.write(ROUTE_CACHE_MAGIC)
+    f.write(np.array([len(headerBytes)], dtype='<u8').tobytes())
+    f.write(headerBytes)
+    for name, values in arrays.items():
+        f.write(b"\x00" * (header['arrays'][name][0] - f.tell()))
+        f.write(values.tobytes())
+    f.close()
+
+###########################################################
+#Loads route data written by writeRouteCache, mapping the #
+#   arrays from the file rather than reading them in      #
+#PARAMS:                                                  #
+#   -path: file written by writeRouteCache                #
+#RETURNS:                                                 #
+#   -Dictionary of route data in the same form as         #
+#       loadRouteData                                     #
+###########################################################
+def loadRouteCache(path):
+    f = open(path, "rb")
+    if f.read(len(ROUTE_CACHE_MAGIC)) != ROUTE_CACHE_MAGIC:
+        f.close()
+        raise ValueError(path + " is not a route file written by writeRouteCache")
+    headerLength = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+    header = json.loads(f.read(headerLength))
+    f.close()
+
+    arrays = {}
+    for name, (offset, dtype, count) in header['arrays'].items():
+        arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,)) if count else np.zeros(0, dtype)
+
+    stopOffsets = arrays['stopOffsets'].tolist()
+    stops = arrays['stops'].tolist()
+    times = arrays['timeFromFirstStop'].tolist()
+    shares = arrays['ridershipShare'].tolist()
+    stopNames = header['stopNames']
+    routeData = {}
+    for route, name in enumerate(header['names']):
+        first, last = stopOffsets[route], stopOffsets[route+1]
+        routeData[name] = {
+            'stops': [stopNames[stop] for stop in stops[first:last]],
+            'timeFromFirstStop': times[first:last],
+            'ridershipShare': shares[route]
+        }
+
+    return routeData
+
+def generateEmptyBusStats(routes):
     busStats = {}
 
-    for key in routeData.keys():
+    for key in routes['names']:
         busStats[key] = {
             'totalBusses': 0,
             'totalRiders':0, 
             'timeEmpty':0,
             'timeRunning':0,
-            'mostRiders':0
+            'mostRiders':0,
+            'peakLoads': [] #histogram of each bus's most riders at one time
         }
 
     return busStats
 
+###########################################################
+#Makes empty rider statistics. Besides the totals, each   #
+#   of DISTRIBUTION_METRICS keeps a histogram over every  #
+#   rider ('all'), by route name ('byRoute') and by hour  #
+#   of day the rider arrived ('byHour', 24 histograms).   #
+#   Histograms are bounded in size no matter how many     #
+#   riders are counted, and are merged by adding them.    #
+###########################################################
 def generateEmptyRiderStats():
     riderStats = {
         'totalRiders': 0,
         'timeWaitingForBus': 0,
         'timeOnBus': 0,
-        'totalTime': 0
+        'totalTime': 0,
+        'distributions': {metric: {'all': [], 'byRoute': {}, 'byHour': [[] for _ in range(24)]}
+                          for metric in DISTRIBUTION_METRICS}
     }
     return riderStats
 
@@ -348,15 +2275,17 @@ def generateEmptyRiderStats():
 #   completed their trip.                                 #
 #PARAMS:                                                  #
 #   -stats: Dictionary of tracked rider statistics        #
-#   -rider: rider that just completed trip                #
+#   -timeArrived: time rider arrived at their stop        #
+#   -timeBoarded: time rider boarded their bus            #
+#   -timeTripEnded: time rider got off the bus            #
 #RETURNS:                                                 #
 #   -updated stats dictionary                             #
 ###########################################################
-def trackRiderStats(stats, rider):
+def trackRiderStats(stats, timeArrived, timeBoarded, timeTripEnded):
     stats['totalRiders'] += 1
-    stats['timeWaitingForBus'] += rider['timeBoarded'] - rider['timeArrived']
-    stats['timeOnBus'] += rider['timeTripEnded'] - rider['timeBoarded']
-    stats['totalTime'] += rider['timeTripEnded'] - rider['timeArrived']
+    stats['timeWaitingForBus'] += timeBoarded - timeArrived
+    stats['timeOnBus'] += timeTripEnded - timeBoarded
+    stats['totalTime'] += timeTripEnded - timeArrived
     return stats
 
 ###########################################################
@@ -369,16 +2298,172 @@ def trackRiderStats(stats, rider):
 #   -updated stats dictionary                             #
 ###########################################################
 def trackBusStats(stats, bus):
-    route = bus['route']
+    route = bus.route
     stats[route]['totalBusses'] += 1
-    stats[route]['totalRiders'] += bus['totalRiders']
-    stats[route]['timeEmpty'] += bus['timeEmpty']
-    stats[route]['timeRunning'] += bus['timeRunning']
-    if stats[route]['mostRiders'] < bus['mostSimultaneousRiders']:
-        stats[route]['mostRiders'] = bus['mostSimultaneousRiders']
+    stats[route]['totalRiders'] += bus.totalRiders
+    stats[route]['timeEmpty'] += bus.timeEmpty
+    stats[route]['timeRunning'] += bus.timeRunning
+    if stats[route]['mostRiders'] < bus.mostSimultaneousRiders:
+        stats[route]['mostRiders'] = bus.mostSimultaneousRiders
+    addToHistogram(stats[route]['peakLoads'], bus.mostSimultaneousRiders)
 
     return stats
 
+###########################################################
+#Adds a batch of finished trips to the rider time         #
+#   distributions. Kept apart from trackRiderStats so the #
+#   histograms are filled a whole array at a time instead #
+#   of once per rider in the event loop.                  #
+#PARAMS:                                                  #
+#   -stats: Dictionary of tracked rider statistics        #
+#   -routes: compiled route information                   #
+#   -route: array of each rider's route index             #
+#   -timeArrived, timeBoarded, timeTripEnded: arrays of   #
+#       each rider's times                                #
+#RETURNS:                                                 #
+#   -updated stats dictionary                             #
+###########################################################
+def trackRiderDistributions(stats, routes, route, timeArrived, timeBoarded, timeTripEnded):
+    route = np.asarray(route, dtype=np.int64)
+    timeArrived = np.asarray(timeArrived, dtype=np.int64)
+    timeBoarded = np.asarray(timeBoarded, dtype=np.int64)
+    timeTripEnded = np.asarray(timeTripEnded, dtype=np.int64)
+    hour = timeArrived // 60
+    times = {
+        'timeWaitingForBus': timeBoarded - timeArrived,
+        'timeOnBus': timeTripEnded - timeBoarded,
+        'totalTime': timeTripEnded - timeArrived
+    }
+
+    for metric in DISTRIBUTION_METRICS:
+        distribution = stats['distributions'][metric]
+        bins = histogramBins(times[metric])
+        addBinCounts(distribution['all'], np.bincount(bins))
+
+        byRoute = np.bincount(route*HISTOGRAM_BINS + bins, minlength=len(routes['names'])*HISTOGRAM_BINS)
+        for index, counts in enumerate(byRoute.reshape(-1, HISTOGRAM_BINS)):
+            if counts.any():
+                addBinCounts(distribution['byRoute'].setdefault(routes['names'][index], []), counts)
+
+        byHour = np.bincount(hour*HISTOGRAM_BINS + bins, minlength=24*HISTOGRAM_BINS)
+        for index, counts in enumerate(byHour.reshape(-1, HISTOGRAM_BINS)):
+            addBinCounts(distribution['byHour'][index], counts)
+
+    return stats
+
+###########################################################
+#Adds one shard's or worker's statistics into another's,  #
+#   totals and histograms alike                           #
+#PARAMS:                                                  #
+#   -stats: Dictionary of rider or bus statistics to add  #
+#       into                                              #
+#   -other: Dictionary of the same kind to add            #
+#RETURNS:                                                 #
+#   -updated stats dictionary                             #
+###########################################################
+def mergeRiderStats(stats, other):
+    for key in ('totalRiders', 'timeWaitingForBus', 'timeOnBus', 'totalTime'):
+        stats[key] += other[key]
+    for metric in DISTRIBUTION_METRICS:
+        distribution = stats['distributions'][metric]
+        otherDistribution = other['distributions'][metric]
+        addBinCounts(distribution['all'], otherDistribution['all'])
+        for name, histogram in otherDistribution['byRoute'].items():
+            addBinCounts(distribution['byRoute'].setdefault(name, []), histogram)
+        for hour, histogram in enumerate(otherDistribution['byHour']):
+            addBinCounts(distribution['byHour'][hour], histogram)
+
+    return stats
+
+def mergeBusStats(stats, other):
+    for route in other:
+        for key in ('totalBusses', 'totalRiders', 'timeEmpty', 'timeRunning'):
+            stats[route][key] += other[route][key]
+        stats[route]['mostRiders'] = max(stats[route]['mostRiders'], other[route]['mostRiders'])
+        addBinCounts(stats[route]['peakLoads'], other[route]['peakLoads'])
+
+    return stats
+
+###########################################################
+#Histograms are plain lists of counts per bin, so they    #
+#   pickle and round trip through JSON unchanged. A list  #
+#   is only as long as its highest non-empty bin, and     #
+#   never longer than HISTOGRAM_BINS. Values are exact    #
+#   below HISTOGRAM_EXACT and within 1/HISTOGRAM_SUBBINS  #
+#   of their true value above it.                         #
+###########################################################
+def histogramBin(value):
+    if value < HISTOGRAM_EXACT:
+        return value
+    doubling = value.bit_length() - HISTOGRAM_EXACT.bit_length()
+    shift = value.bit_length() - HISTOGRAM_SUBBINS.bit_length()
+    return min(HISTOGRAM_EXACT + doubling*HISTOGRAM_SUBBINS + (value >> shift) - HISTOGRAM_SUBBINS, HISTOGRAM_BINS - 1)
+
+#histogramBin of every value in a NumPy array of non-negative integers
+def histogramBins(values):
+    values = np.asarray(values, dtype=np.int64)
+    bins = values.copy()
+    large = values >= HISTOGRAM_EXACT
+    if large.any():
+        bins[large] = [histogramBin(value) for value in values[large].tolist()]
+    return bins
+
+#smallest value that falls in a bin
+def histogramBinValue(index):
+    if index < HISTOGRAM_EXACT:
+        return index
+    doubling, subBin = divmod(index - HISTOGRAM_EXACT, HISTOGRAM_SUBBINS)
+    return (HISTOGRAM_SUBBINS + subBin) << (doubling + HISTOGRAM_EXACT.bit_length() - HISTOGRAM_SUBBINS.bit_length())
+
+def addToHistogram(histogram, value):
+    index = histogramBin(value)
+    if index >= len(histogram):
+        histogram.extend([0] * (index + 1 - len(histogram)))
+    histogram[index] += 1
+
+#adds counts per bin, a list or NumPy array, into a histogram
+def addBinCounts(histogram, counts):
+    counts = [int(count) for count in counts]
+    while counts and not counts[-1]:
+        counts.pop()
+    if len(counts) > len(histogram):
+        histogram.extend([0] * (len(counts) - len(histogram)))
+    for index, count in enumerate(counts):
+        histogram[index] += count
+
+#sum of every value counted in a histogram, exact if they are all under HISTOGRAM_EXACT
+def histogramTotal(histogram):
+    return sum(histogramBinValue(index) * n for index, n in enumerate(histogram))
+
+###########################################################
+#Summarizes a histogram                                   #
+#PARAMS:                                                  #
+#   -histogram: list of counts per bin                    #
+#   -percentiles: percentiles to report                   #
+#RETURNS:                                                 #
+#   -Dictionary of 'count', 'mean' and 'p' + percentile   #
+#       for each percentile, the smallest value at least  #
+#       that percent of the counted values are at or      #
+#       under, all 0 for an empty histogram               #
+###########################################################
+def summarizeHistogram(histogram, percentiles=(50, 90, 99)):
+    count = sum(histogram)
+    summary = {'count': count, 'mean': 0}
+    if count:
+        summary['mean'] = sum(histogramBinValue(index) * n for index, n in enumerate(histogram)) / count
+    for percentile in percentiles:
+        rank = -(-count * percentile // 100) #riders at or under the percentile, rounded up
+        seen = 0
+        value = 0
+        for index, n in enumerate(histogram):
+            seen += n
+            if n and seen >= rank:
+                value = histogramBinValue(index)
+                break
+        summary['p' + str(percentile)] = value
+
+    return summary
+
 ###########################################################
 #Makes total rider statistics into a string after         #
 #   simulation has completed. This is for printing or     #
@@ -399,6 +2484,10 @@ def printRiderStats(stats):
     riderLog += "\tAverage Wait Time = " + str(timeWaiting/totalRiders) + " minutes\n"
     riderLog += "\tAverage Time On Bus = " + str(timeOnBus/totalRiders) + " minutes\n"
     riderLog += "\tAverage Trip Length = " + str(totalTime/totalRiders) + " minutes\n"
+    wait = summarizeHistogram(stats['distributions']['timeWaitingForBus']['all'])
+    trip = summarizeHistogram(stats['distributions']['totalTime']['all'])
+    riderLog += "\t90th/99th Percentile Wait Time = " + str(wait['p90']) + "/" + str(wait['p99']) + " minutes\n"
+    riderLog += "\t90th/99th Percentile Trip Length = " + str(trip['p90']) + "/" + str(trip['p99']) + " minutes\n"
 
     return riderLog
 
@@ -428,28 +2517,201 @@ def printBusStats(stats):
         busLog += "\t\tUtilization Rate = " + str((timeRunning-timeEmpty)/timeRunning) + "\n"
         busLog += "\t\tMost Riders At One Time= " + str(mostRiders) + " riders\n"
         busLog += "\t\tAverage number of riders per bus = " + str(totalRiders/totalBusses) + " riders per bus\n"
+        load = summarizeHistogram(stats[i]['peakLoads'])
+        busLog += "\t\tMedian/90th/99th Percentile Most Riders Per Bus = " + str(load['p50']) + "/" \
+                  + str(load['p90']) + "/" + str(load['p99']) + " riders\n"
 
     return busLog
 
-def writeRiderStats(numberOfRiders,timeBetweenBusses,riderStats):
-    f = open("riderstats.csv", "a")
-    line = str(numberOfRiders)+","+str(timeBetweenBusses)+","
-    line += str(riderStats['timeWaitingForBus'])+","+str(riderStats['timeOnBus'])+","
-    line += str(riderStats['totalTime'])+"\n"
-    f.write(line)
-    f.close()
+#columns of the result files
+RIDER_STATS_COLUMNS = ['riders', 'minutes', 'seed', 'timeWaitingForBus', 'timeOnBus', 'totalTime']
+BUS_STATS_COLUMNS = ['riders', 'minutes', 'seed', 'route', 'totalBusses', 'totalRiders', 'timeEmpty', 'timeRunning', 'mostRiders']
+RIDER_DETAIL_COLUMNS = ['riders', 'minutes', 'seed', 'rider', 'route', 'startingLocation', 'endLocation', 'direction',
+                        'timeArrived', 'timeBoarded', 'timeTripEnded']
+BUS_DETAIL_COLUMNS = ['riders', 'minutes', 'seed', 'bus', 'route', 'direction', 'timeDeparted',
+                      'totalRiders', 'mostRiders', 'timeEmpty', 'timeRunning']
+REPLICATION_COLUMNS = ['riders', 'minutes', 'seed', 'replications', 'days', 'meanWait', 'waitHalfWidth']
+PERCENTILE_COLUMNS = ['riders', 'minutes', 'seed', 'metric', 'route', 'hour', 'count', 'mean', 'p50', 'p90', 'p99']
+
+###########################################################
+#Buffered writer for a table of results. Rows are kept in #
+#   memory and written a chunk at a time, to a CSV file   #
+#   with a header row, or to a Parquet file if the path   #
+#   ends in .parquet and pyarrow is installed. Appending  #
+#   to an existing CSV file checks its header first, so   #
+#   files with different columns are never mixed.         #
+###########################################################
+class RecordWriter:
+    __slots__ = ('path', 'columns', 'chunkSize', 'chunks', 'rows', 'bufferedRows', 'file', 'writer')
+
+    def __init__(self, path, columns, append=False, chunkSize=65536):
+        self.path = path
+        self.columns = columns
+        self.chunkSize = chunkSize
+        self.chunks = [] #dictionaries of NumPy columns added with write
+        self.rows = [] #rows added with writeRow
+        self.bufferedRows = 0
+
+        if path.endswith(".parquet"):
+            if append:
+                raise ValueError("cannot append to Parquet file " + path)
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("writing " + path + " needs pyarrow, install it or write .csv instead")
+            self.file = None
+            self.writer = None
+            return
 
-def writeBusStats(numberOfRiders,timeBetweenBusses,busStats):
-    f = open("busstats.csv","a")
+        exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            f = open(path, newline="")
+            header = next(csv.reader(f), None)
+            f.close()
+            if header != columns:
+                raise ValueError(path + " has columns " + str(header) + ", expected " + str(columns))
+        self.file = open(path, "a" if append else "w", newline="")
+        self.writer = csv.writer(self.file)
+        if not exists:
+            self.writer.writerow(columns)
+
+    #adds rows given as a dictionary of equal length columns, lists or NumPy arrays
+    def write(self, rows):
+        self.moveRowsToChunks()
+        chunk = {column: np.asarray(rows[column]) for column in self.columns}
+        self.chunks.append(chunk)
+        self.bufferedRows += len(chunk[self.columns[0]])
+        if self.bufferedRows >= self.chunkSize:
+            self.flush()
+
+    def writeRow(self, values):
+        self.rows.append(values)
+        self.bufferedRows += 1
+        if self.bufferedRows >= self.chunkSize:
+            self.flush()
+
+    #keeps rows from writeRow in the order they came in relative to write
+    def moveRowsToChunks(self):
+        if self.rows:
+            columns = list(zip(*self.rows))
+            self.chunks.append({column: np.array(values, dtype=object) for column, values in zip(self.columns, columns)})
+            self.rows = []
+
+    def flush(self):
+        if not self.bufferedRows:
+            return
+        self.moveRowsToChunks()
+        if self.file is None:
+            import pyarrow
+            import pyarrow.parquet
+            for chunk in self.chunks:
+                table = pyarrow.table({column: chunk[column].tolist() if chunk[column].dtype == object else chunk[column]
+                                       for column in self.columns})
+                if self.writer is None:
+                    self.writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+                self.writer.write_table(table.cast(self.writer.schema))
+        else:
+            for chunk in self.chunks:
+                self.writer.writerows(zip(*[chunk[column].tolist() for column in self.columns]))
+        self.chunks = []
+        self.bufferedRows = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+        elif self.writer is not None:
+            self.writer.close()
+
+###########################################################
+#Writes the per rider and per bus detail records of one   #
+#   sweep cell                                            #
+#PARAMS:                                                  #
+#   -riderWriter: RecordWriter with RIDER_DETAIL_COLUMNS  #
+#   -busWriter: RecordWriter with BUS_DETAIL_COLUMNS      #
+#   -numberOfRiders, timeBetweenBus, seed: the cell       #
+#   -details: dictionary filled in by runDay              #
+#   -routes: compiled route information                   #
+###########################################################
+def writeDetails(riderWriter,busWriter,numberOfRiders,timeBetweenBus,seed,details,routes):
+    riders = details['riders']
+    count = len(riders['rider'])
+    routeNames = np.array(routes['names'], dtype=object)
+    stopNames = np.array(routes['stopNames'], dtype=object)
+
+    #stop ids along each route, padded so any route and stop index can be looked up at once
+    longestRoute = max(len(stops) for stops in routes['stops'])
+    stopIds = np.zeros((len(routes['stops']), longestRoute), dtype=np.int64)
+    for route, stops in enumerate(routes['stops']):
+        stopIds[route, :len(stops)] = stops
+
+    #riders left behind by the last bus have no boarding or trip end time, written blank (null in Parquet)
+    boarded = riders['timeTripEnded'] > 0
+
+    riderWriter.write({
+        'riders': np.full(count, numberOfRiders),
+        'minutes': np.full(count, timeBetweenBus),
+        'seed': np.full(count, seed),
+        'rider': riders['rider'],
+        'route': routeNames[riders['route']],
+        'startingLocation': stopNames[stopIds[riders['route'], riders['start']]],
+        'endLocation': stopNames[stopIds[riders['route'], riders['end']]],
+        'direction': riders['direction'],
+        'timeArrived': riders['timeArrived'],
+        'timeBoarded': np.where(boarded, riders['timeBoarded'], None),
+        'timeTripEnded': np.where(boarded, riders['timeTripEnded'], None)
+    })
+
+    for bus in details['busses']:
+        busWriter.writeRow([numberOfRiders, timeBetweenBus, seed, bus.id, bus.route, bus.direction, bus.timeDeparted,
+                            bus.totalRiders, bus.mostSimultaneousRiders, bus.timeEmpty, bus.timeRunning])
+
+###########################################################
+#Writes total rider statistics of one sweep cell          #
+#PARAMS:                                                  #
+#   -writer: RecordWriter with RIDER_STATS_COLUMNS        #
+###########################################################
+def writeRiderStats(writer,numberOfRiders,timeBetweenBusses,seed,riderStats):
+    writer.writeRow([numberOfRiders, timeBetweenBusses, seed, riderStats['timeWaitingForBus'],
+                     riderStats['timeOnBus'], riderStats['totalTime']])
+
+###########################################################
+#Writes each route's bus statistics of one sweep cell     #
+#PARAMS:                                                  #
+#   -writer: RecordWriter with BUS_STATS_COLUMNS          #
+###########################################################
+def writeBusStats(writer,numberOfRiders,timeBetweenBusses,seed,busStats):
     for i in busStats.keys():
-        line = str(numberOfRiders)+","+str(timeBetweenBusses)+","+i+","
-        line += str(busStats[i]['totalBusses']) + ","
-        line += str(busStats[i]['totalRiders']) + ","
-        line += str(busStats[i]['timeEmpty']) + ","
-        line += str(busStats[i]['timeRunning']) + ","
-        line += str(busStats[i]['mostRiders']) + "\n"
-        f.write(line)
-    f.close()
+        writer.writeRow([numberOfRiders, timeBetweenBusses, seed, i, busStats[i]['totalBusses'],
+                         busStats[i]['totalRiders'], busStats[i]['timeEmpty'], busStats[i]['timeRunning'],
+                         busStats[i]['mostRiders']])
+
+###########################################################
+#Writes percentiles of one sweep cell's rider times over  #
+#   every rider, by route and by hour of day, and of the  #
+#   most riders on each bus by route. Route and hour are  #
+#   'all' on rows covering every route or hour.           #
+#PARAMS:                                                  #
+#   -writer: RecordWriter with PERCENTILE_COLUMNS         #
+###########################################################
+def writePercentiles(writer,numberOfRiders,timeBetweenBusses,seed,riderStats,busStats):
+    def writeSummary(metric, route, hour, histogram):
+        summary = summarizeHistogram(histogram)
+        writer.writeRow([numberOfRiders, timeBetweenBusses, seed, metric, route, hour, summary['count'],
+                         summary['mean'], summary['p50'], summary['p90'], summary['p99']])
+
+    for metric in DISTRIBUTION_METRICS:
+        distribution = riderStats['distributions'][metric]
+        writeSummary(metric, 'all', 'all', distribution['all'])
+        for route in busStats:
+            if route in distribution['byRoute']:
+                writeSummary(metric, route, 'all', distribution['byRoute'][route])
+        for hour, histogram in enumerate(distribution['byHour']):
+            if histogram:
+                writeSummary(metric, 'all', hour, histogram)
+    for route in busStats:
+        writeSummary('mostRiders', route, 'all', busStats[route]['peakLoads'])
     
 
 def printBusArt():
@@ -0,0 +1,191 @@
+#RTD Bus Simulation - GTFS Importer
+#CSCI 4203
+#Created by: Koy Kubasta
+
+import argparse
+import csv
+import json
+import os
+import time
+from collections import Counter
+
+import bussimulation
+
+
+###########################################################
+#Reads a table of a GTFS feed one row at a time           #
+#PARAMS:                                                  #
+#   -directory: directory of the unzipped feed            #
+#   -name: file name of the table, like "stops.txt"       #
+#   -columns: column names to pick out of each row        #
+#RETURNS:                                                 #
+#   -Iterator of lists of the picked columns' values, ""  #
+#       for a column the file does not have               #
+###########################################################
+def readTable(directory, name, columns):
+    #feeds are often saved with a byte order mark, which utf-8-sig drops
+    f = open(os.path.join(directory, name), newline="", encoding="utf-8-sig")
+    reader = csv.reader(f)
+    header = [column.strip() for column in next(reader, [])]
+    indexes = [header.index(column) if column in header else None for column in columns]
+    for row in reader:
+        if row:
+            yield [row[index].strip() if index is not None and index < len(row) else "" for index in indexes]
+    f.close()
+
+###########################################################
+#Converts a GTFS time to seconds after midnight. Times    #
+#   past midnight are written as hours over 24.           #
+#RETURNS:                                                 #
+#   -int seconds, or None for a blank time                #
+###########################################################
+def parseTime(value):
+    if not value:
+        return None
+    hours, minutes, seconds = value.split(":")
+    return int(hours)*3600 + int(minutes)*60 + int(seconds)
+
+###########################################################
+#Fills in blank stop times, which GTFS allows at stops    #
+#   that are not timepoints, by spacing them evenly       #
+#   between the timed stops either side                   #
+#PARAMS:                                                  #
+#   -times: list of seconds or None, first and last given #
+#RETURNS:                                                 #
+#   -list of seconds with every blank filled in           #
+###########################################################
+def interpolateTimes(times):
+    filled = list(times)
+    last = 0
+    for i in range(1, len(filled)):
+        if filled[i] is None:
+            continue
+        gap = i - last
+        for j in range(last+1, i):
+            filled[j] = filled[last] + (filled[i] - filled[last]) * (j - last) // gap
+        last = i
+
+    return filled
+
+###########################################################
+#Builds the route model used by the simulation from a     #
+#   GTFS feed. Each route is modelled by its most common  #
+#   stop pattern in one direction, with busses running it #
+#   both ways. Times from the first stop are the median   #
+#   over the trips running that pattern, in whole         #
+#   minutes.                                              #
+#PARAMS:                                                  #
+#   -directory: directory of the unzipped feed, with      #
+#       stops.txt, trips.txt and stop_times.txt, and      #
+#       routes.txt for route names if it has one          #
+#   -ridership: dictionary of daily boardings (or any     #
+#       relative weight) by route name, None to weight    #
+#       routes by their number of trips, as GTFS has no   #
+#       ridership                                         #
+#RETURNS:                                                 #
+#   -Dictionary of route data in the same form as         #
+#       bussimulation.loadRouteData                       #
+###########################################################
+def importGTFS(directory, ridership=None):
+    stopNames = {}
+    for stopId, stopName in readTable(directory, "stops.txt", ["stop_id", "stop_name"]):
+        stopNames[stopId] = stopName or stopId
+
+    #route short names are what riders know routes by, but are not always unique
+    routeNames = {}
+    if os.path.exists(os.path.join(directory, "routes.txt")):
+        names = list(readTable(directory, "routes.txt", ["route_id", "route_short_name", "route_long_name"]))
+        counts = Counter(shortName or longName or routeId for routeId, shortName, longName in names)
+        for routeId, shortName, longName in names:
+            name = shortName or longName or routeId
+            routeNames[routeId] = name if counts[name] == 1 else routeId
+
+    trips = {}
+    for tripId, routeId, directionId in readTable(directory, "trips.txt", ["trip_id", "route_id", "direction_id"]):
+        trips[tripId] = (routeId, directionId or "0")
+
+    tripStops = {}
+    for tripId, sequence, stopId, arrival, departure in readTable(
+            directory, "stop_times.txt", ["trip_id", "stop_sequence", "stop_id", "arrival_time", "departure_time"]):
+        if tripId in trips:
+            if tripId not in tripStops:
+                tripStops[tripId] = []
+            tripStops[tripId].append((int(sequence), stopId, parseTime(arrival or departure)))
+
+    #group each route's trips in its first direction by the stops they make
+    patterns = {}
+    tripCounts = Counter()
+    for tripId, stops in tripStops.items():
+        routeId, directionId = trips[tripId]
+        tripCounts[routeId] += 1
+        stops.sort()
+        times = [t for _, _, t in stops]
+        if len(stops) < 2 or times[0] is None or times[-1] is None:
+            continue
+        pattern = tuple(stopId for _, stopId, _ in stops)
+        routePatterns = patterns.setdefault(routeId, {})
+        routePatterns.setdefault(directionId, {}).setdefault(pattern, []).append(interpolateTimes(times))
+
+    routeData = {}
+    for routeId in sorted(patterns, key=lambda routeId: routeNames.get(routeId, routeId)):
+        byPattern = patterns[routeId][min(patterns[routeId])]
+        #most trips first, then most stops, then the pattern itself so ties always break the same way
+        pattern = max(byPattern, key=lambda stops: (len(byPattern[stops]), len(stops), stops))
+
+        timeFromFirstStop = []
+        for stop in range(len(pattern)):
+            offsets = sorted(times[stop] - times[0] for times in byPattern[pattern])
+            minutes = round(offsets[len(offsets)//2] / 60)
+            #rounding can not make a later stop come before an earlier one, but bad feed data can
+            timeFromFirstStop.append(max(minutes, timeFromFirstStop[-1]) if timeFromFirstStop else 0)
+
+        name = routeNames.get(routeId, routeId)
+        routeData[name] = {
+            'stops': [stopNames.get(stopId, stopId) for stopId in pattern],
+            'timeFromFirstStop': timeFromFirstStop,
+            'ridershipShare': tripCounts[routeId] if ridership is None else ridership.get(name, 0)
+        }
+
+    total = sum(route['ridershipShare'] for route in routeData.values())
+    if not total:
+        raise ValueError("no ridership for any route imported from " + directory)
+    for route in routeData.values():
+        route['ridershipShare'] /= total
+
+    return routeData
+
+###########################################################
+#Reads daily boardings by route from a CSV file with      #
+#   'route' and 'boardings' columns                       #
+###########################################################
+def loadRidership(path):
+    f = open(path, newline="")
+    ridership = {row['route']: float(row['boardings']) for row in csv.DictReader(f)}
+    f.close()
+    return ridership
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import routes from a GTFS feed for the bus simulation")
+    parser.add_argument("gtfs", help="directory of an unzipped GTFS feed")
+    parser.add_argument("--output", default="network" + bussimulation.ROUTE_CACHE_SUFFIX,
+                        help="binary route file to write, loaded with bussimulation.py --routes")
+    parser.add_argument("--json", metavar="FILE", default=None, help="also write the routes as JSON like routes.json")
+    parser.add_argument("--ridership", metavar="CSV", default=None,
+                        help="daily boardings by route, with route and boardings columns, instead of trip counts")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    routeData = importGTFS(args.gtfs, loadRidership(args.ridership) if args.ridership else None)
+    print("Imported " + str(len(routeData)) + " routes in " + str(round(time.perf_counter() - start, 3)) + " s")
+
+    bussimulation.writeRouteCache(routeData, args.output)
+    print("Wrote " + args.output)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(routeData, f, indent=4)
+        print("Wrote " + args.json)
+
+
+if __name__ == "__main__":
+    main()